@@ -23,23 +23,26 @@ sys.path.append(str(parent_path))
 
 def db_check() -> Optional[str]:
     from logger import log
-    from sqlite import connect, close, newdb
+    from sqlite import connect, close, migrate, newdb
     from utils import find_newest_file_in_dir as lookup_file, get_system_id
     from zerr import zerr
 
     try:
-        db_dir = os.path.join(parent_path, os.environ["ASSET_DIR"])
-        if not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-        db_path = lookup_file(db_dir, ".db")
+        db_path = os.getenv("DB_PATH")
         if db_path is None:
-            new_db_name = f"{get_system_id()}.db"
-            new_db_path = os.path.join(db_dir, new_db_name)
-            newdb(new_db_path)
-            return new_db_path
+            db_dir = os.path.join(parent_path, os.environ["ASSET_DIR"])
+            if not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            db_path = lookup_file(db_dir, ".db")
+            if db_path is None:
+                db_path = os.path.join(db_dir, f"{get_system_id()}.db")
+        if not os.path.exists(db_path):
+            newdb(db_path)
+            return db_path
         else:
             test = connect(db_path)
             if test is not None:
+                migrate(test)
                 close(test)
                 return db_path
             else:
@@ -55,14 +58,28 @@ def db_check() -> Optional[str]:
 if __name__ == "__main__":
     import argparse
 
-    os.environ["DB_PATH"] = str(db_check())
-
     parser = argparse.ArgumentParser(
         description="Check audio and subtitle tracks in a video file."
     )
     parser.add_argument(
         "-f", "--filepath", type=str, help="Path to the video file."
     )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        help="Scan every video file listed in this file, one path per line, "
+        "in a single process. Use - to read the list from stdin.",
+        default=None,
+    )
+    parser.add_argument(
+        "-0",
+        "--null",
+        type=int,
+        help="Boolean for the batch list being separated by NUL characters "
+        "instead of newlines or not. Use 0 for False, 1 for True.",
+        default=0,
+    )
     parser.add_argument(
         "-s",
         "--search",
@@ -77,13 +94,206 @@ if __name__ == "__main__":
         help="Boolean for reconciling or not. Use 0 for False, 1 for True.",
         default=0,
     )
+    parser.add_argument(
+        "-d",
+        "--dedupe",
+        type=int,
+        help="Boolean for recomputing duplicates across the whole database "
+        "or not. Use 0 for False, 1 for True.",
+        default=0,
+    )
+    parser.add_argument(
+        "--hash",
+        type=int,
+        help="Boolean for hashing the contents of files that share a size, "
+        "to find exact copies, or not. Use 0 for False, 1 for True.",
+        default=0,
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        help="Number of threads listing directories during search. "
+        "(default: 8)",
+        default=8,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of probe worker processes for reconcile. (default: 1)",
+        default=1,
+    )
+    parser.add_argument(
+        "--mount-limits",
+        type=str,
+        help="Per-mount limits on concurrent probes during reconcile, as "
+        "comma-separated MOUNT=N pairs. Other mounts use --workers.",
+        default=None,
+    )
+    parser.add_argument(
+        "--resume",
+        type=int,
+        help="Boolean for continuing an interrupted search or reconcile "
+        "from its last checkpoint or not. Use 0 for False, 1 for True.",
+        default=0,
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        help="Only scan the share K/N of the library's top-level folders, "
+        "for example 2/3 on the second of three hosts.",
+        default=None,
+    )
+    parser.add_argument(
+        "--diff",
+        type=str,
+        help="Write the files a search added (+) and found missing (-) "
+        "to this file.",
+        default=None,
+    )
+    parser.add_argument(
+        "--merge",
+        type=str,
+        nargs="+",
+        help="Merge these per-host database files into this host's "
+        "database.",
+        default=None,
+    )
+    parser.add_argument(
+        "--serve",
+        type=str,
+        help="Run a scan service on this localhost host:port or Unix "
+        "socket path, accepting POST /scan and GET /status.",
+        default=None,
+    )
+    parser.add_argument(
+        "--watch",
+        type=int,
+        help="Boolean for watching the library folders for new or changed "
+        "files or not. Use 0 for False, 1 for True.",
+        default=0,
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=int,
+        help="Seconds between directory sweeps that catch changes inotify "
+        "misses, 0 to disable. (default: 300)",
+        default=300,
+    )
+
+    parser.add_argument(
+        "-l",
+        "--log-level",
+        type=str,
+        help="Drop log records below this level (DEBUG, INFO, WARNING, "
+        "ERROR, CRITICAL). (default: DEBUG)",
+        default=os.getenv("LOG_LEVEL", "DEBUG"),
+    )
+    parser.add_argument(
+        "--async-log",
+        type=int,
+        help="Boolean for writing logs from a background thread or not. "
+        "Use 0 for False, 1 for True.",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--metrics-prom",
+        type=str,
+        help="Write per-stage metrics to this Prometheus textfile after "
+        "the run.",
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=str,
+        help="Write per-stage metrics to this JSON file after the run.",
+        default=None,
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    report_parser = subparsers.add_parser(
+        "report", help="Stream a report of the media database."
+    )
+    report_parser.add_argument(
+        "kind",
+        choices=[
+            "incomplete",
+            "missing-eng-subs",
+            "duplicates",
+            "sidecar-only",
+            "dirs",
+        ],
+        help="Files not marked complete, files without an English "
+        "subtitle track, files with duplicates, files whose only subtitles "
+        "are sidecars, or per-folder counts.",
+    )
+    report_parser.add_argument(
+        "--format",
+        type=str,
+        choices=["table", "csv", "jsonl"],
+        help="Output format. (default: table)",
+        default="table",
+    )
+    report_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Write the report to this file instead of stdout.",
+        default=None,
+    )
+    report_parser.add_argument(
+        "--under",
+        type=str,
+        help="Only report files under this folder.",
+        default=None,
+    )
 
     args = parser.parse_args()
 
-    if args.reconcile == 1:
+    os.environ["DB_PATH"] = str(db_check())
+
+    from logger import set_log_level, start_background_logging
+
+    set_log_level(args.log_level)
+    if args.async_log == 1:
+        start_background_logging()
+
+    if args.command == "report":
+        from report import report
+
+        report(args.kind, args.format, args.output, args.under)
+    elif args.merge:
+        from shard import merge_databases
+
+        merge_databases(args.merge)
+    elif args.hash == 1:
+        from hashing import hash_contents
+
+        hash_contents(args.threads)
+    elif args.dedupe == 1:
+        from app import dedupe
+
+        dedupe()
+    elif args.reconcile == 1:
         from app import reconcile
+        from scheduler import parse_mount_limits
+
+        reconcile(
+            args.workers,
+            args.resume == 1,
+            parse_mount_limits(args.mount_limits),
+        )
+    elif args.serve:
+        from service import serve
 
-        reconcile()
+        serve(args.serve)
+    elif args.watch == 1:
+        from watch import watch
+
+        roots = (args.filepath or os.getcwd()).split(os.pathsep)
+        watch(roots, args.watch_interval)
     elif args.search == 1:
         from app import search
 
@@ -92,7 +302,29 @@ if __name__ == "__main__":
         if top_level_folder is None:
             top_level_folder = os.getcwd()
 
-        search(top_level_folder)
+        shard = None
+        if args.shard:
+            from shard import parse_shard
+
+            shard = parse_shard(args.shard)
+
+        search(
+            top_level_folder,
+            args.threads,
+            args.resume == 1,
+            shard,
+            args.diff,
+        )
+    elif args.batch is not None:
+        from app import scan_paths
+        from utils import read_paths
+
+        separator = b"\0" if args.null == 1 else b"\n"
+        if args.batch == "-":
+            scan_paths(read_paths(sys.stdin.buffer, separator))
+        else:
+            with open(args.batch, "rb") as paths_file:
+                scan_paths(read_paths(paths_file, separator))
     else:
         if args.filepath is None:
             from logger import log
@@ -105,28 +337,22 @@ if __name__ == "__main__":
             )
             log(error_info, "CRITICAL")
         else:
-            from app import check_audio_subtitle
+            from app import scan_file
+            from sqlite import open_session
 
-            normalized_absolute_path = (
-                os.path.abspath(args.filepath)
-            ).replace("\\", "/")
-            normalized_absolute_path = normalized_absolute_path.replace(
-                "'", "`"
-            )
-            result = check_audio_subtitle(normalized_absolute_path)
+            session = open_session()
+            try:
+                result = scan_file(args.filepath, session)
 
-            if "error" in result:
-                raise Exception(result["error"])
-            else:
-                from sqlite import connect
-                from app import update
-
-                connection = connect(os.environ["DB_PATH"])
-                if connection is None:
-                    raise Exception("Failed to connect to database.")
-                update(
-                    connection,
-                    "media",
-                    {"complete": "True"},
-                    {"id": str(result["id"])},
-                )
+                if "error" in result:
+                    raise Exception(result["error"])
+            finally:
+                session.close()
+
+    if args.metrics_prom or args.metrics_json:
+        from metrics import write_json, write_prometheus
+
+        if args.metrics_prom:
+            write_prometheus(args.metrics_prom)
+        if args.metrics_json:
+            write_json(args.metrics_json)
@@ -1,53 +1,72 @@
 import os
-
-
-from pydub.utils import mediainfo
-from pymkv import MKVFile
-from typing import Optional, Union, List, Dict
-
-
-from logger import log
-from sqlite import connect, insert, raw_query, SQLiteConn
+import time
+
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Union, List, Dict, Iterable, Iterator, Tuple
+
+
+from avi import read_tracks as read_avi_tracks
+from cache import close_cache, lookup, store, touch
+from checkpoint import (
+    checkpoint_seconds,
+    clear_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from hashing import content_duplicates
+from known import missing_paths, KnownPaths
+from logger import log, log_enabled
+from metrics import observe, timer
+from mkv import read_tracks as read_mkv_tracks
+from mp4 import read_tracks as read_mp4_tracks
+from scheduler import ordered, MountQueue, Record
+from shard import shard_filters
+from sidecar import prime_directory, sidecars_for
+from sqlite import open_session, DBSession
+from srtlang import detect_language, sidecar_language
+from utils import (
+    content_key,
+    file_fingerprint,
+    language_code,
+    normalize_path,
+    title_key,
+)
+from walker import walk_directories, MediaEntry
 from zerr import zerr
 
 
 def check_audio_subtitle(
     file_path: str,
+    session: Optional[DBSession] = None,
 ) -> Dict[str, Union[int, List[str], str]]:
-    connection = None
-    og_filepath = os.path.abspath(file_path)
-    og_filepath = og_filepath.replace("/", "\\")
-    og_filepath = og_filepath.replace("`", "'")
-    filepath = og_filepath.replace("\\", "/")
-    filepath = filepath.replace("'", "`")
-    try:
-        connection = connect(os.environ["DB_PATH"])
-    except Exception as e:
-        error_info = f"[Failed to connect to database for check]:{zerr(e)}"
-        log(error_info, "CRITICAL")
-        return {"error": error_info}
-    if connection is None:
-        error_info = (
-            "[Failed to connect to database for check]:Connection is None"
-        )
-        log(error_info, "CRITICAL")
-        return {"error": error_info}
+    og_filepath, filepath = normalize_path(file_path)
+    owns_session = session is None
+    if session is None:
+        try:
+            session = open_session()
+        except Exception as e:
+            error_info = (
+                f"[Failed to connect to database for check]:{zerr(e)}"
+            )
+            log(error_info, "CRITICAL")
+            return {"error": error_info}
     try:
-        existing_records = raw_query(
-            connection,
-            "SELECT id, complete FROM " f"media where filepath = '{filepath}'",
+        existing_records = session.raw_query(
+            "SELECT id, complete FROM media WHERE filepath = ?",
+            [filepath],
         )
 
         if not existing_records:
-            insert(
-                connection,
+            session.insert(
                 "media",
-                [None, filepath, None, None, None, None, None, None],
+                [filepath, title_key(filepath)],
+                ["filepath", "title_key"],
             )
-            existing_records = raw_query(
-                connection,
-                "SELECT id, complete FROM "
-                f"media where filepath = '{filepath}'",
+            existing_records = session.raw_query(
+                "SELECT id, complete FROM media WHERE filepath = ?",
+                [filepath],
             )
         if existing_records[0][1] == "True":
             return {}
@@ -57,147 +76,362 @@ def check_audio_subtitle(
             "audio": [],
             "subtitles": [],
         }
+        result.update(probe_tracks(og_filepath))
+        record_tracks(session, og_filepath, filepath, result)
 
-        if og_filepath.endswith(".mkv"):
-            mkv = MKVFile(og_filepath)
+        return result
+    except Exception as e:
+        error_info = f"[Failed to check audio and subtitle tracks]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return {"error": error_info}
+    finally:
+        if owns_session:
+            session.close()
 
-            audio_tracks = [
-                track for track in mkv.tracks if track.track_type == "audio"
-            ]
-            for track in audio_tracks:
-                if not result["audio"] is None or len(result["audio"]) > 0:
-                    result["audio"].append(track.language)
-
-                subtitle_tracks = [
-                    track
-                    for track in mkv.tracks
-                    if track.track_type == "subtitles"
-                ]
-                for track in subtitle_tracks:
-                    if (
-                        not result["subtitles"] is None
-                        or len(result["subtitles"]) > 0
-                    ):
-                        result["subtitles"].append(track.language)
-            if (
-                "eng" in result["subtitles"]
-                and len(result["audio"]) > 0
-                and len(result["subtitles"]) > 0
-            ):
-                update(
-                    connection,
-                    "media",
-                    {"complete": "True", "embedded": "True"},
-                    {"id": result["id"]},
-                )
 
-        elif og_filepath.endswith(".mp4") or og_filepath.endswith(".avi"):
-            info = mediainfo(og_filepath)
+def scan_file(file_path: str, session: DBSession) -> Dict:
+    result = check_audio_subtitle(os.path.abspath(file_path), session)
+    if "id" in result and "error" not in result:
+        session.update("media", {"complete": "True"}, {"id": result["id"]})
+    return result
 
-            if "streams" not in info:
-                streams = [info]
-            else:
-                streams = info["streams"]
 
-            for stream in streams:
-                if stream.get("codec_type") == "audio":
-                    result["audio"].append(stream.get("language", "unknown"))
+def scan_paths(paths: Iterable[str]) -> Optional[Dict[str, int]]:
+    session = None
+    try:
+        session = open_session()
+    except Exception as e:
+        error_info = f"[Failed to connect to database for batch]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    counts = {"scanned": 0, "failed": 0}
+    try:
+        for path in paths:
+            result = scan_file(path, session)
+            counts["failed" if "error" in result else "scanned"] += 1
+        log(
+            f"[Batch]:{counts['scanned']} files scanned, "
+            f"{counts['failed']} failed",
+            "INFO",
+            success=True,
+        )
+        return counts
+    finally:
+        session.close()
+        close_cache()
+
+
+def probe_tracks(
+    og_filepath: str,
+) -> Dict[str, Union[bool, List[str], Tuple[int, int, int]]]:
+    result = {
+        "audio": [],
+        "subtitles": [],
+        "sidecars": [],
+        "sidecar_languages": [],
+        "sidecar_detections": {},
+        "embedded": False,
+        "complete": False,
+        "fingerprint": file_fingerprint(og_filepath),
+    }
+
+    start = time.perf_counter()
+    result["cache_key"] = content_key(og_filepath, result["fingerprint"][0])
+    tracks = lookup(result["cache_key"])
+    result["cache_hit"] = tracks is not None
+    if tracks is None:
+        tracks = embedded_tracks(og_filepath)
+    result["tracks"] = tracks
+    result["timings"] = {"probe": time.perf_counter() - start}
+    for track in tracks:
+        if track["kind"] == "audio":
+            result["audio"].append(track["language"])
+        elif track["kind"] == "subtitle":
+            result["subtitles"].append(track["language"])
+
+    if og_filepath.endswith(".mkv"):
+        if "eng" in result["subtitles"] and len(result["audio"]) > 0:
+            result["embedded"] = True
+            result["complete"] = True
+    else:
+        if len(result["audio"]) > 0 and len(result["subtitles"]) > 0:
+            result["embedded"] = True
+
+        start = time.perf_counter()
+        result["sidecars"] = find_srt(og_filepath)
+        languages, detections = detect_srt(og_filepath, result["sidecars"])
+        result["sidecar_languages"] = languages
+        result["sidecar_detections"] = detections
+        result["timings"]["srt"] = time.perf_counter() - start
+
+    return result
+
+
+def embedded_tracks(og_filepath: str) -> List[Dict[str, str]]:
+    tracks = []
+    if og_filepath.endswith(".mkv"):
+        parsed = read_mkv_tracks(og_filepath)
+        if parsed is not None:
+            return parsed
+
+        from pymkv import MKVFile
+
+        mkv = MKVFile(og_filepath)
+        for track in mkv.tracks:
+            tracks.append(
+                {
+                    "kind": (
+                        "subtitle"
+                        if track.track_type == "subtitles"
+                        else track.track_type
+                    ),
+                    "language": track.language,
+                    "codec": track.track_codec,
+                }
+            )
 
-            for stream in streams:
-                if stream.get("codec_type") == "subtitle":
-                    result["subtitles"].append(
-                        stream.get("language", "unknown")
-                    )
+    elif og_filepath.endswith(".mp4") or og_filepath.endswith(".avi"):
+        if og_filepath.endswith(".mp4"):
+            parsed = read_mp4_tracks(og_filepath)
+        else:
+            parsed = read_avi_tracks(og_filepath)
+        if parsed is not None:
+            return parsed
 
-            if len(result["audio"]) > 0 and len(result["subtitles"]) > 0:
-                update(
-                    connection,
-                    "media",
-                    {"embedded": "True"},
-                    {"id": result["id"]},
-                )
+        from pydub.utils import mediainfo
 
-            check_srt(og_filepath, filepath, connection, result)
+        info = mediainfo(og_filepath)
 
+        if "streams" not in info:
+            streams = [info]
         else:
-            raise Exception(f"Unsupported file type: {og_filepath}")
+            streams = info["streams"]
 
-        if len(result["audio"]) > 0:
-            update(
-                connection,
-                "media",
-                {"audio": ",".join(result["audio"])},
-                {"id": result["id"]},
+        for stream in streams:
+            tracks.append(
+                {
+                    "kind": stream.get("codec_type"),
+                    "language": stream.get("language", "unknown"),
+                    "codec": stream.get("codec_name"),
+                }
             )
 
-        if len(result["subtitles"]) > 0:
-            for subtitle in result["subtitles"]:
-                if subtitle == ".en" or subtitle == ".eng":
-                    result["subtitles"].add("eng")
-                elif subtitle == "unknown":
-                    result["subtitles"].remove("unknown")
-            update(
-                connection,
-                "media",
-                {"subs": ",".join(result["subtitles"])},
-                {"id": result["id"]},
+    else:
+        raise Exception(f"Unsupported file type: {og_filepath}")
+
+    return tracks
+
+
+def record_tracks(
+    session: DBSession,
+    og_filepath: str,
+    filepath: str,
+    result: Dict[str, Union[int, bool, List[str], Tuple[int, int, int]]],
+) -> None:
+    for stage, seconds in result["timings"].items():
+        observe(stage, seconds, filepath)
+
+    if result["cache_hit"]:
+        touch(result["cache_key"])
+    else:
+        store(result["cache_key"], result["tracks"])
+    for key, detection in result["sidecar_detections"].items():
+        store(key, detection)
+
+    session.execute(
+        "DELETE FROM tracks WHERE media_id = ? AND source = 'embedded'",
+        [result["id"]],
+    )
+    for track in result["tracks"]:
+        if track["kind"] in ("audio", "subtitle"):
+            session.insert(
+                "tracks",
+                [
+                    result["id"],
+                    track["kind"],
+                    language_code(track["language"] or "unknown"),
+                    track.get("codec"),
+                    "embedded",
+                ],
+                ["media_id", "kind", "language", "codec", "source"],
             )
 
-        check_for_duplicate(og_filepath)
+    size, mtime, inode = result["fingerprint"]
+    session.execute(
+        "UPDATE media SET content_hash = NULL, full_hash = NULL "
+        "WHERE id = ? AND (size IS NOT ? OR mtime IS NOT ?)",
+        [result["id"], size, mtime],
+    )
+    session.update(
+        "media",
+        {
+            "size": size,
+            "mtime": mtime,
+            "inode": inode,
+            "probed_at": time.time(),
+        },
+        {"id": result["id"]},
+    )
+
+    if result["complete"]:
+        session.update(
+            "media",
+            {"complete": "True", "embedded": "True"},
+            {"id": result["id"]},
+        )
+    elif result["embedded"]:
+        session.update(
+            "media",
+            {"embedded": "True"},
+            {"id": result["id"]},
+        )
 
-        return result
-    except Exception as e:
-        error_info = f"[Failed to check audio and subtitle tracks]:{zerr(e)}"
-        log(error_info, "CRITICAL")
-        return {"error": error_info}
+    if len(result["sidecars"]) > 0:
+        check_srt(og_filepath, filepath, session, result)
 
+    if len(result["audio"]) > 0:
+        session.update(
+            "media",
+            {"audio": ",".join(result["audio"])},
+            {"id": result["id"]},
+        )
 
-def check_for_duplicate(file_path: str) -> Optional[bool]:
-    og_filepath = os.path.abspath(file_path)
-    og_filepath = og_filepath.replace("/", "\\")
-    og_filepath = og_filepath.replace("`", "'")
-    filepath = og_filepath.replace("\\", "/")
-    filepath = filepath.replace("'", "`")
-    connection = None
-    try:
-        connection = connect(os.environ["DB_PATH"])
-    except Exception as e:
-        error_info = f"[Failed to connect to database for check]:{zerr(e)}"
-        log(error_info, "CRITICAL")
-        return
-    if connection is None:
-        error_info = (
-            "[Failed to connect to database for check]:Connection is None"
+    if len(result["subtitles"]) > 0:
+        subtitles = []
+        for subtitle in result["subtitles"]:
+            if subtitle == ".en" or subtitle == ".eng":
+                subtitle = "eng"
+            elif subtitle == "unknown":
+                continue
+            if subtitle not in subtitles:
+                subtitles.append(subtitle)
+        result["subtitles"] = subtitles
+        session.update(
+            "media",
+            {"subs": ",".join(result["subtitles"])},
+            {"id": result["id"]},
         )
-        log(error_info, "CRITICAL")
-        return
+
+    with timer("duplicate", filepath):
+        check_for_duplicate(og_filepath, session)
+
+
+def probe_pool(
+    chunks: Iterable[List[Record]],
+    workers: int,
+    mount_limits: Optional[Dict[str, int]] = None,
+) -> Iterator[Tuple[Record, Dict[str, Union[bool, List[str], str]]]]:
+    queue = MountQueue(mount_limits or {}, workers)
+    chunks = iter(chunks)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Bumped whenever a dead worker forces a new pool, so the other futures
+    # failing with the old pool do not restart the new one.
+    generation = 0
+    in_flight = {}
     try:
-        basename_with_ext = os.path.basename(og_filepath)
-        basename_no_ext = os.path.splitext(basename_with_ext)[0]
-        converted_basename_no_ext = basename_no_ext.replace("'", "`")
-        converted_basename_no_ext = converted_basename_no_ext.replace(
-            "\\", "/"
-        )
-        existing_records = raw_query(
-            connection,
-            f"SELECT id FROM media WHERE filepath LIKE "
-            f"'%{converted_basename_no_ext}%' "
-            f"AND filepath NOT LIKE '{filepath}'",
+        while True:
+            # The next chunk is only read once the queue runs low, so at
+            # most about two chunks are held in memory.
+            if len(queue) < workers * 4:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    queue.add(chunk)
+            while len(in_flight) < workers * 4:
+                taken = queue.take()
+                if taken is None:
+                    break
+                og_filepath, _ = normalize_path(taken[1][1])
+                try:
+                    future = executor.submit(probe_tracks, og_filepath)
+                except BrokenProcessPool:
+                    # The pool broke after the last wait; this file never
+                    # ran, so it goes back to the front of its queue.
+                    queue.retry(*taken)
+                    executor = restart_pool(executor, workers)
+                    generation += 1
+                    continue
+                in_flight[future] = (taken, generation)
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                (mount, record), started_in = in_flight.pop(future)
+                queue.release(mount)
+                try:
+                    yield record, future.result()
+                except BrokenProcessPool as e:
+                    # Every file in flight when a worker dies fails with it,
+                    # and the run carries on with a fresh pool.
+                    if started_in == generation:
+                        executor = restart_pool(executor, workers)
+                        generation += 1
+                    error_info = (
+                        f"[Probe worker died while probing {record[1]}]:"
+                        f"{zerr(e)}"
+                    )
+                    log(error_info, "CRITICAL")
+                    yield record, {"error": error_info}
+                except Exception as e:
+                    error_info = f"[Failed to probe {record[1]}]:{zerr(e)}"
+                    log(error_info, "CRITICAL")
+                    yield record, {"error": error_info}
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def restart_pool(
+    executor: ProcessPoolExecutor, workers: int
+) -> ProcessPoolExecutor:
+    executor.shutdown(wait=False, cancel_futures=True)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def check_for_duplicate(
+    file_path: str, session: Optional[DBSession] = None
+) -> Optional[bool]:
+    og_filepath, filepath = normalize_path(file_path)
+    owns_session = session is None
+    if session is None:
+        try:
+            session = open_session()
+        except Exception as e:
+            error_info = (
+                f"[Failed to connect to database for check]:{zerr(e)}"
+            )
+            log(error_info, "CRITICAL")
+            return
+    try:
+        hashed = session.raw_query(
+            "SELECT id, content_hash, full_hash FROM media "
+            "WHERE filepath = ? AND content_hash IS NOT NULL",
+            [filepath],
         )
+        if hashed:
+            # Hashed files are only duplicates of identical content.
+            existing_records = [
+                (path,)
+                for path in content_duplicates(
+                    session, og_filepath, hashed[0]
+                )
+            ]
+        else:
+            key = title_key(filepath)
+            if not key:
+                return False
+            existing_records = session.raw_query(
+                "SELECT filepath FROM media WHERE title_key = ? "
+                "AND filepath != ?",
+                [key, filepath],
+            )
         records = []
         for record in existing_records:
-            record_filepath = raw_query(
-                connection,
-                f"SELECT filepath FROM media WHERE id = {record[0]}",
-            )
-            if not record_filepath[0][0].endswith(".srt"):
-                records.append(record_filepath[0][0])
+            if not record[0].endswith(".srt"):
+                records.append(record[0])
             else:
                 continue
 
         if len(records) > 0:
-            update(
-                connection,
+            session.update(
                 "media",
                 {"duplicate": ",".join(records)},
                 {"filepath": filepath},
@@ -209,174 +443,404 @@ def check_for_duplicate(file_path: str) -> Optional[bool]:
         error_info = f"[Failed to check for duplicate]:{zerr(e)}"
         log(error_info, "CRITICAL")
         return
+    finally:
+        if owns_session:
+            session.close()
 
 
-def reconcile():
-    connection = None
+def dedupe() -> Optional[int]:
+    session = None
     try:
-        connection = connect(os.environ["DB_PATH"])
+        session = open_session()
     except Exception as e:
-        error_info = f"[Failed to connect to database for reconcile]:{zerr(e)}"
+        error_info = f"[Failed to connect to database for dedupe]:{zerr(e)}"
         log(error_info, "CRITICAL")
         return
-    if connection is None:
-        error_info = (
-            "[Failed to connect to database for reconcile]:Connection is None"
+    try:
+        session.execute(
+            "UPDATE media SET title_key = title_key(filepath) "
+            "WHERE title_key IS NULL"
         )
+        session.execute(
+            "UPDATE media SET duplicate = CASE "
+            "WHEN content_hash IS NOT NULL THEN ("
+            "SELECT group_concat(other.filepath, ',') FROM media AS other "
+            "WHERE other.content_hash = media.content_hash "
+            "AND other.full_hash = media.full_hash "
+            "AND other.id != media.id) "
+            "ELSE ("
+            "SELECT group_concat(other.filepath, ',') FROM media AS other "
+            "WHERE other.title_key = media.title_key "
+            "AND media.title_key IS NOT NULL AND media.title_key != '' "
+            "AND other.id != media.id "
+            "AND other.filepath NOT LIKE '%.srt') END"
+        )
+        session.commit()
+        duplicates = session.raw_query(
+            "SELECT COUNT(*) FROM media WHERE duplicate IS NOT NULL"
+        )
+        log(
+            f"[Dedupe]:{duplicates[0][0]} files have duplicates",
+            "INFO",
+            success=True,
+        )
+        return duplicates[0][0]
+    except Exception as e:
+        error_info = f"[Failed to dedupe media records]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    finally:
+        session.close()
+
+
+def reconcile(
+    workers: int = 1,
+    resume: bool = False,
+    mount_limits: Optional[Dict[str, int]] = None,
+    chunk_size: int = 2000,
+):
+    session = None
+    try:
+        session = open_session()
+    except Exception as e:
+        error_info = f"[Failed to connect to database for reconcile]:{zerr(e)}"
         log(error_info, "CRITICAL")
         return
     try:
-        records = raw_query(
-            connection,
-            "SELECT id, filepath FROM media WHERE id IS NOT NULL "
-            "AND filepath IS NOT NULL AND complete IS NOT 'True'",
+        started = time.time()
+        state = load_checkpoint(session, "reconcile") if resume else None
+        if state is not None:
+            started = state["started"]
+            log(
+                f"[Reconcile]:Resuming the run started at {started}, "
+                "skipping files probed since",
+                "INFO",
+                success=True,
+            )
+        save_checkpoint(session, "reconcile", {"started": started})
+        counts = {"pending": 0, "changed": 0}
+        chunks = pending_chunks(session, started, chunk_size, counts)
+        if workers > 1:
+            reconcile_parallel(
+                session, chunks, workers, mount_limits, chunk_size
+            )
+        else:
+            for chunk in chunks:
+                for _, record in ordered(chunk):
+                    check_result = check_audio_subtitle(record[1], session)
+                    if "error" in check_result:
+                        continue
+                session.commit()
+        log(
+            f"[Reconcile]:{counts['changed']} of {counts['pending']} pending "
+            "files were new or changed since their last probe",
+            "INFO",
+            success=True,
         )
-        for record in records:
-            og_filepath = os.path.abspath(record[1])
-            filepath = og_filepath.replace("\\", "/")
-            filepath = filepath.replace("'", "`")
-            check_result = check_audio_subtitle(filepath)
-            if "error" in check_result:
-                continue
-            if "id" in check_result and "embedded" in check_result == "True":
-                update(
-                    connection,
-                    "media",
-                    {"complete": "True"},
-                    {"id": str(check_result["id"])},
-                )
+        clear_checkpoint(session, "reconcile")
     except Exception as e:
         error_info = (
             f"[Failed to reconcile audio and subtitle tracks]:{zerr(e)}"
         )
         log(error_info, "CRITICAL")
         return
+    finally:
+        session.close()
+        close_cache()
+
+
+def pending_chunks(
+    session: DBSession,
+    started: float,
+    chunk_size: int,
+    counts: Dict[str, int],
+) -> Iterator[List[Record]]:
+    # Pages are read by id rather than by offset, so each page is an index
+    # seek and rows probed in the meantime cannot shift the next page. Files
+    # probed during an interrupted run are recognised by probed_at, which is
+    # committed with their results.
+    last_id = 0
+    while True:
+        records = session.raw_query(
+            "SELECT id, filepath, size, mtime, inode, probed_at FROM media "
+            "WHERE id > ? AND filepath IS NOT NULL "
+            "AND complete IS NOT 'True' "
+            "AND (probed_at IS NULL OR probed_at < ?) "
+            "ORDER BY id LIMIT ?",
+            [last_id, started, chunk_size],
+        )
+        if not records:
+            return
+        last_id = records[-1][0]
+        changed = changed_records(records)
+        counts["pending"] += len(records)
+        counts["changed"] += len(changed)
+        if changed:
+            yield changed
+
+
+def changed_records(records: List[tuple]) -> List[Record]:
+    changed = []
+    dir_mtimes: Dict[str, int] = {}
+    for record_id, filepath, size, mtime, inode, probed_at in records:
+        # Merged rows can carry a fingerprint without a probe time.
+        if size is not None and probed_at is not None:
+            og_filepath, _ = normalize_path(filepath)
+            dirname = os.path.dirname(og_filepath)
+            try:
+                if dirname not in dir_mtimes:
+                    dir_mtimes[dirname] = os.stat(dirname).st_mtime_ns
+                # New or renamed sidecars only touch the directory mtime.
+                if dir_mtimes[dirname] <= probed_at * 1e9 and (
+                    file_fingerprint(og_filepath) == (size, mtime, inode)
+                ):
+                    continue
+            except OSError as e:
+                error_info = f"[Skipping missing file {filepath}]:{zerr(e)}"
+                log(error_info, "WARNING")
+                continue
+        changed.append((record_id, filepath, inode))
+    return changed
+
+
+def reconcile_parallel(
+    session: DBSession,
+    chunks: Iterable[List[Record]],
+    workers: int,
+    mount_limits: Optional[Dict[str, int]] = None,
+    chunk_size: int = 2000,
+) -> None:
+    failed = 0
+    probes = probe_pool(chunks, workers, mount_limits)
+    for done, (record, probe) in enumerate(probes, 1):
+        if "error" in probe:
+            failed += 1
+        else:
+            try:
+                og_filepath, filepath = normalize_path(record[1])
+                result = {"id": record[0]}
+                result.update(probe)
+                record_tracks(session, og_filepath, filepath, result)
+            except Exception as e:
+                failed += 1
+                error_info = f"[Failed to record {record[1]}]:{zerr(e)}"
+                log(error_info, "CRITICAL")
+        if done % chunk_size == 0:
+            session.commit()
+        if log_enabled("INFO"):
+            log(
+                f"[Reconcile Progress]:{done} probed ({failed} failed) "
+                f"{record[1]}",
+                "INFO",
+                success=True,
+            )
 
 
-def search(top_level_folder: str):
-    connection = None
+def search(
+    top_level_folder: str,
+    threads: int = 8,
+    resume: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    diff: Optional[str] = None,
+):
+    session = None
     try:
-        connection = connect(os.environ["DB_PATH"])
+        session = open_session()
     except Exception as e:
         error_info = f"[Failed to connect to database for search]:{zerr(e)}"
         log(error_info, "CRITICAL")
         return
-    if connection is None:
-        error_info = (
-            "[Failed to connect to database for search]:Connection is None"
-        )
+    try:
+        top_level_folder = os.path.abspath(top_level_folder)
+        name = f"search:{top_level_folder}"
+        if shard is not None:
+            name += f"#{shard[0]}/{shard[1]}"
+        skip, keep = shard_filters(top_level_folder, shard)
+        with timer("lookup"):
+            known = KnownPaths(session, top_level_folder, keep)
+        added: List[str] = []
+        pending = {top_level_folder}
+        state = load_checkpoint(session, name) if resume else None
+        if state is not None:
+            pending = set(state["pending"])
+            log(
+                f"[Search]:Resuming with {len(pending)} folders left to list",
+                "INFO",
+                success=True,
+            )
+        last_checkpoint = time.monotonic()
+        batch: List[MediaEntry] = []
+        for listing, subdirs in walk_directories(
+            sorted(pending), threads, skip
+        ):
+            dirname, mtime_ns, sidecars, media = listing
+            pending.discard(dirname)
+            pending.update(subdirs)
+            prime_directory(dirname, mtime_ns, sidecars)
+            if keep is not None:
+                media = [
+                    entry
+                    for entry in media
+                    if keep(normalize_path(entry[0], resolve=False)[1])
+                ]
+            batch.extend(media)
+            if len(batch) >= 500:
+                added.extend(record_paths(session, batch, known))
+                batch = []
+            if time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                # Every listed folder's files must be recorded before the
+                # checkpoint drops the folder from the pending set.
+                if batch:
+                    added.extend(record_paths(session, batch, known))
+                    batch = []
+                save_checkpoint(session, name, {"pending": sorted(pending)})
+                last_checkpoint = time.monotonic()
+        if batch:
+            added.extend(record_paths(session, batch, known))
+        clear_checkpoint(session, name)
+        report_diff(session, known, added, state is not None, diff)
+    except Exception as e:
+        error_info = f"[Failed to search for media files]:{zerr(e)}"
         log(error_info, "CRITICAL")
-        return
-    for root, _, files in os.walk(top_level_folder):
-        for file in files:
-            try:
-                if file.endswith((".mp4", ".mkv", ".avi")):
-                    og_filepath = os.path.abspath(os.path.join(root, file))
-                    og_filepath = og_filepath.replace("/", "\\")
-                    og_filepath = og_filepath.replace("`", "'")
-                    filepath = og_filepath.replace("\\", "/")
-                    filepath = filepath.replace("'", "`")
-                    existing_records = raw_query(
-                        connection,
-                        f"SELECT id FROM media WHERE filepath = '{filepath}'",
-                    )
-                    if existing_records:
-                        continue
-                    insert(
-                        connection,
+    finally:
+        session.close()
+
+
+def record_paths(
+    session: DBSession, media: List[MediaEntry], known: KnownPaths
+) -> List[str]:
+    paths = {}
+    added = []
+    with timer("normalize"):
+        for path, size, mtime, inode in media:
+            og_filepath, filepath = normalize_path(path, resolve=False)
+            paths[filepath] = (og_filepath, (size, mtime, inode))
+    for filepath, (og_filepath, fingerprint) in paths.items():
+        try:
+            record = known.take(filepath)
+            if record is not None:
+                record_id, complete = record[:2]
+                stored = tuple(record[2:5])
+                if (
+                    complete == "True"
+                    and stored[0] is not None
+                    and fingerprint != stored
+                ):
+                    session.update(
                         "media",
-                        [None, filepath, None, None, None, None, None, None],
-                    )
-                elif file.endswith(".srt"):
-                    og_filepath = os.path.abspath(os.path.join(root, file))
-                    og_filepath = og_filepath.replace("/", "\\")
-                    og_filepath = og_filepath.replace("`", "'")
-                    filepath = og_filepath.replace("\\", "/")
-                    filepath = filepath.replace("'", "`")
-
-                    media_name, lang_code = (
-                        file.rsplit(".", 2)[0],
-                        file.rsplit(".", 2)[1],
-                    )
-                    if lang_code == ".en" or ".eng":
-                        lang_code = "eng"
-                    existing_records = raw_query(
-                        connection,
-                        "SELECT id FROM media WHERE filepath = "
-                        f"'{media_name}.mkv'",
+                        {"complete": None},
+                        {"id": record_id},
                     )
-                    if existing_records:
-                        update(
-                            connection,
-                            "media",
-                            {"misc": f"{media_name}.{lang_code}.srt"},
-                            conditions={"filepath": f"{media_name}.mkv"},
-                        )
-            except Exception as e:
-                error_info = f"[Failed to search for media files]:{zerr(e)}"
-                log(error_info, "CRITICAL")
+            else:
+                session.insert(
+                    "media",
+                    [filepath, title_key(filepath)],
+                    ["filepath", "title_key"],
+                )
+                added.append(filepath)
+            sidecars = sidecars_for(og_filepath, revalidate=False)
+            if not sidecars:
                 continue
+            misc = sidecar_misc(sidecars)
+            if record is None or record[5] != misc:
+                session.update(
+                    "media",
+                    {"misc": misc},
+                    {"filepath": filepath},
+                )
+        except Exception as e:
+            error_info = f"[Failed to search for media files]:{zerr(e)}"
+            log(error_info, "CRITICAL")
+            continue
+    return added
+
+
+def report_diff(
+    session: DBSession,
+    known: KnownPaths,
+    added: List[str],
+    resumed: bool,
+    diff: Optional[str] = None,
+) -> None:
+    # A resumed search only walks the folders left over from the last run,
+    # so files it did not see are not necessarily missing.
+    missing = [] if resumed else known.missing_ids()
+    if resumed:
+        summary = f"{len(added)} added, missing files not checked"
+    else:
+        summary = f"{len(added)} added, {len(missing)} missing"
+    log(f"[Search]:{summary}", "INFO", success=True)
+    if diff is None:
+        return
+    session.commit()
+    with open(diff, "w", encoding="utf-8") as stream:
+        for filepath in added:
+            stream.write(f"+ {filepath}\n")
+        for filepath in missing_paths(session, missing):
+            stream.write(f"- {filepath}\n")
 
 
-def check_srt(
-    og_filepath: str, filepath: str, connection: SQLiteConn, result
-) -> Optional[bool]:
+def find_srt(og_filepath: str) -> List[Tuple[str, str]]:
+    return list(sidecars_for(og_filepath))
+
+
+def sidecar_misc(sidecars: List[Tuple[str, str]]) -> str:
+    # The real file names, as search and reconcile must write the same
+    # value.
+    return ",".join(name.replace("'", "`") for _, name in sidecars)
+
+
+def detect_srt(
+    og_filepath: str, sidecars: List[Tuple[str, str]]
+) -> Tuple[List[str], Dict[str, List[Dict[str, Union[str, float]]]]]:
+    # Runs in the probe workers; new detections are handed back so the
+    # main process can cache them by sidecar fingerprint.
+    languages = []
+    detections = {}
     dirname = os.path.dirname(og_filepath)
-    basename_no_ext = os.path.splitext(os.path.basename(og_filepath))[0]
-
-    for potential_srt in os.listdir(dirname):
-        if potential_srt.startswith(
-            basename_no_ext
-        ) and potential_srt.endswith(".srt"):
-            lang_code = ""
-            if potential_srt.count(".") == 2:
-                lang_code = "." + potential_srt.rsplit(".", 2)[1]
-            result["subtitles"].append(lang_code)
-            converted_basename_no_ext = basename_no_ext.replace("'", "`")
-            converted_basename_no_ext = converted_basename_no_ext.replace(
-                "\\", "/"
-            )
-            misc_cache = raw_query(
-                connection,
-                f"SELECT misc FROM media WHERE id = {result['id']}",
-            )
-            srt_name = f"{converted_basename_no_ext}{lang_code}.srt"
-            misccache = misc_cache[0][0]
-            if misccache is None:
-                misc_result = srt_name
-            elif srt_name in misccache:
-                misc_result = misccache
-            else:
-                misc_result = misccache + "," + srt_name
-            update(
-                connection,
-                "media",
-                {
-                    "misc": misc_result,
-                },
-                {"id": result["id"]},
+    for lang_code, name in sidecars:
+        sidecar_filepath = os.path.join(dirname, name)
+        key = "srt:{}:{}:{}".format(*file_fingerprint(sidecar_filepath))
+        detection = lookup(key)
+        if detection is None:
+            language, confidence = detect_language(sidecar_filepath)
+            detection = [{"language": language, "confidence": confidence}]
+            detections[key] = detection
+        languages.append(
+            sidecar_language(
+                language_code(lang_code) if lang_code else "",
+                detection[0]["language"],
+                detection[0]["confidence"],
             )
+        )
+    return languages, detections
 
 
-def update(
-    connection: SQLiteConn,
-    table_name: str,
-    values: Dict[str, Union[int, str, bytes, float, None]],
-    conditions: Dict[str, Union[int, str, bytes, float, None]],
+def check_srt(
+    og_filepath: str, filepath: str, session: DBSession, result
 ) -> Optional[bool]:
-    try:
-        cursor = connection.cursor()
-        set_clause = ", ".join(f"{key} = ?" for key in values.keys())
-        set_clause.replace("\\", "/")
-        set_clause.replace("'", "`")
-        where_clause = " AND ".join(f"{key} = ?" for key in conditions.keys())
-        query = f"UPDATE {table_name} SET {set_clause} WHERE {where_clause}"
-        cursor.execute(
-            query, list(values.values()) + list(conditions.values())
+    session.execute(
+        "DELETE FROM tracks WHERE media_id = ? AND source = 'sidecar'",
+        [result["id"]],
+    )
+    for language in result["sidecar_languages"]:
+        result["subtitles"].append(language)
+        session.insert(
+            "tracks",
+            [
+                result["id"],
+                "subtitle",
+                language,
+                "srt",
+                "sidecar",
+            ],
+            ["media_id", "kind", "language", "codec", "source"],
         )
-        connection.commit()
-        return True
-    except Exception as e:
-        error_info = f"[Update Failed]:{zerr(e)}"
-        log(error_info, "CRITICAL")
-        return False
+    session.update(
+        "media",
+        {
+            "misc": sidecar_misc(result["sidecars"]),
+        },
+        {"id": result["id"]},
+    )
+    return True
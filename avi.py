@@ -0,0 +1,126 @@
+import re
+
+
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+
+from utils import language_aliases, language_code
+
+# Function specific variables and aliases
+
+
+stream_kinds = {b"auds": "audio", b"vids": "video", b"txts": "subtitle"}
+subtitle_handlers = {b"DXSB", b"DXSA"}
+max_chunks = 64
+max_header_size = 1024 * 1024
+
+
+# Functions
+
+
+def read_chunk_header(stream: BinaryIO) -> Optional[Tuple[bytes, int]]:
+    header = stream.read(8)
+    if len(header) < 8:
+        return None
+    return header[:4], int.from_bytes(header[4:], "little")
+
+
+def iter_chunks(data: bytes) -> List[Tuple[bytes, bytes]]:
+    chunks = []
+    pos = 0
+    while pos + 8 <= len(data):
+        chunk_id = data[pos : pos + 4]
+        size = int.from_bytes(data[pos + 4 : pos + 8], "little")
+        chunks.append((chunk_id, data[pos + 8 : pos + 8 + size]))
+        pos += 8 + size + (size & 1)
+    return chunks
+
+
+def name_language(name: bytes) -> Optional[str]:
+    text = name.split(b"\x00", 1)[0].decode("latin-1").strip()
+    if not text:
+        return None
+    code = language_code(text)
+    if code in language_aliases.values():
+        return code
+    for word in re.split(r"[\W_]+", text):
+        code = language_code(word)
+        if len(word) > 2 and code in language_aliases.values():
+            return code
+    return None
+
+
+def parse_hdrl(data: bytes) -> List[Dict[str, Optional[str]]]:
+    streams = []
+    for chunk_id, chunk in iter_chunks(data):
+        if chunk_id != b"LIST" or chunk[:4] != b"strl":
+            continue
+        kind = None
+        language = None
+        codec = None
+        for child_id, child in iter_chunks(chunk[4:]):
+            if child_id == b"strh":
+                kind = stream_kinds.get(child[:4])
+                if child[4:8] in subtitle_handlers:
+                    kind = "subtitle"
+                codec = child[4:8].decode("latin-1").strip("\x00 ") or None
+            elif child_id == b"strf" and kind == "audio" and len(child) >= 2:
+                codec = f"0x{int.from_bytes(child[:2], 'little'):04x}"
+            elif child_id == b"strn":
+                language = name_language(child)
+        if kind is not None:
+            streams.append(
+                {"kind": kind, "language": language, "codec": codec}
+            )
+    return streams
+
+
+def parse_info(data: bytes) -> Optional[str]:
+    for chunk_id, chunk in iter_chunks(data):
+        if chunk_id == b"ILNG":
+            return name_language(chunk)
+    return None
+
+
+def read_tracks(og_filepath: str) -> Optional[List[Dict[str, str]]]:
+    try:
+        with open(og_filepath, "rb") as stream:
+            header = stream.read(12)
+            if header[:4] != b"RIFF" or header[8:12] != b"AVI ":
+                return None
+            streams = None
+            info_language = None
+            for _ in range(max_chunks):
+                chunk = read_chunk_header(stream)
+                if chunk is None:
+                    break
+                chunk_id, size = chunk
+                padded = size + (size & 1)
+                if chunk_id != b"LIST":
+                    stream.seek(padded, 1)
+                    continue
+                list_type = stream.read(4)
+                if list_type not in (b"hdrl", b"INFO"):
+                    stream.seek(padded - 4, 1)
+                    continue
+                if size > max_header_size:
+                    return None
+                data = stream.read(padded - 4)
+                if list_type == b"hdrl":
+                    streams = parse_hdrl(data)
+                else:
+                    info_language = parse_info(data)
+            if not streams:
+                return None
+            return [
+                {
+                    "kind": item["kind"],
+                    "language": item["language"]
+                    or info_language
+                    or "unknown",
+                    "codec": item["codec"],
+                }
+                for item in streams
+            ]
+    except (IndexError, OSError, ValueError):
+        return None
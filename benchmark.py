@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+current_path = Path(__file__).resolve()
+parent_path = current_path.parent
+
+sys.path.append(str(parent_path))
+
+# Function specific variables and aliases
+
+
+languages = ["eng", "jpn", "fre", "ger", "spa", "ita", "und"]
+srt_body = "1\n00:00:01,000 --> 00:00:02,500\nSynthetic subtitle line.\n"
+
+
+# Functions
+
+
+def ebml_size(size: int) -> bytes:
+    for length in range(1, 9):
+        if size < (1 << (7 * length)) - 1:
+            return ((1 << (7 * length)) | size).to_bytes(length, "big")
+    raise ValueError(f"EBML size too large: {size}")
+
+
+def ebml(element_id: int, payload: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + ebml_size(len(payload)) + payload
+
+
+def ebml_uint(element_id: int, value: int) -> bytes:
+    length = max(1, (value.bit_length() + 7) // 8)
+    return ebml(element_id, value.to_bytes(length, "big"))
+
+
+def make_mkv(tracks: List[Tuple[str, str]]) -> bytes:
+    codecs = {
+        "video": "V_MPEG4/ISO/AVC",
+        "audio": "A_AAC",
+        "subtitle": "S_TEXT/UTF8",
+    }
+    types = {"video": 1, "audio": 2, "subtitle": 17}
+    header = ebml(0x1A45DFA3, ebml(0x4282, b"matroska"))
+    entries = b""
+    for number, (kind, language) in enumerate(tracks, 1):
+        entries += ebml(
+            0xAE,
+            ebml_uint(0xD7, number)
+            + ebml_uint(0x83, types[kind])
+            + ebml(0x86, codecs[kind].encode())
+            + ebml(0x22B59C, language.encode()),
+        )
+    info = ebml(0x1549A966, ebml_uint(0x2AD7B1, 1000000))
+    cluster = ebml(0x1F43B675, ebml_uint(0xE7, 0) + b"\xa3\x81\x00")
+    seek_head = ebml(
+        0x114D9B74,
+        ebml(
+            0x4DBB,
+            ebml(0x53AB, (0x1654AE6B).to_bytes(4, "big"))
+            + ebml(0x53AC, (0).to_bytes(4, "big")),
+        ),
+    )
+    position = len(seek_head) + len(info) + len(cluster)
+    seek_head = ebml(
+        0x114D9B74,
+        ebml(
+            0x4DBB,
+            ebml(0x53AB, (0x1654AE6B).to_bytes(4, "big"))
+            + ebml(0x53AC, position.to_bytes(4, "big")),
+        ),
+    )
+    tracks_element = ebml(0x1654AE6B, entries)
+    return header + ebml(
+        0x18538067, seek_head + info + cluster + tracks_element
+    )
+
+
+def mp4_box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def mp4_full_box(box_type: bytes, payload: bytes) -> bytes:
+    return mp4_box(box_type, b"\x00\x00\x00\x00" + payload)
+
+
+def make_mp4(tracks: List[Tuple[str, str]], moov_at_end: bool) -> bytes:
+    handlers = {"video": b"vide", "audio": b"soun", "subtitle": b"sbtl"}
+    formats = {"video": b"avc1", "audio": b"mp4a", "subtitle": b"tx3g"}
+    traks = b""
+    for number, (kind, language) in enumerate(tracks, 1):
+        packed = 0
+        for char in language:
+            packed = (packed << 5) | (ord(char) - 0x60)
+        stsd = mp4_full_box(
+            b"stsd",
+            struct.pack(">I", 1) + mp4_box(formats[kind], b"\x00" * 8),
+        )
+        traks += mp4_box(
+            b"trak",
+            mp4_full_box(
+                b"tkhd", struct.pack(">III", 0, 0, number) + b"\x00" * 68
+            )
+            + mp4_box(
+                b"mdia",
+                mp4_full_box(
+                    b"mdhd", struct.pack(">IIIIHH", 0, 0, 1000, 0, packed, 0)
+                )
+                + mp4_full_box(
+                    b"hdlr", b"\x00" * 4 + handlers[kind] + b"\x00" * 13
+                )
+                + mp4_box(b"minf", mp4_box(b"stbl", stsd)),
+            ),
+        )
+    ftyp = mp4_box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41")
+    moov = mp4_box(b"moov", mp4_full_box(b"mvhd", b"\x00" * 96) + traks)
+    mdat = mp4_box(b"mdat", b"\x00" * 64)
+    return ftyp + (mdat + moov if moov_at_end else moov + mdat)
+
+
+def riff_chunk(chunk_id: bytes, data: bytes) -> bytes:
+    padding = b"\x00" if len(data) & 1 else b""
+    return chunk_id + struct.pack("<I", len(data)) + data + padding
+
+
+def make_avi(tracks: List[Tuple[str, str]]) -> bytes:
+    names = {"eng": "English", "jpn": "Japanese", "fre": "French"}
+    stream_lists = b""
+    for kind, language in tracks:
+        if kind == "video":
+            strh = b"vids" + b"XVID"
+        elif kind == "audio":
+            strh = b"auds" + b"\x00" * 4
+        else:
+            strh = b"vids" + b"DXSB"
+        body = riff_chunk(b"strh", strh + b"\x00" * 48)
+        body += riff_chunk(b"strf", b"\x55\x00" + b"\x00" * 14)
+        if language in names:
+            body += riff_chunk(b"strn", names[language].encode() + b"\x00")
+        stream_lists += riff_chunk(b"LIST", b"strl" + body)
+    hdrl = riff_chunk(
+        b"LIST", b"hdrl" + riff_chunk(b"avih", b"\x00" * 56) + stream_lists
+    )
+    movi = riff_chunk(b"LIST", b"movi" + riff_chunk(b"00dc", b"\x00" * 16))
+    body = b"AVI " + hdrl + movi + riff_chunk(b"idx1", b"\x00" * 16)
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def random_tracks(rng: random.Random) -> List[Tuple[str, str]]:
+    tracks = [("video", "und")]
+    for _ in range(rng.randint(1, 3)):
+        tracks.append(("audio", rng.choice(languages)))
+    for _ in range(rng.choice([0, 0, 1, 2, 3])):
+        tracks.append(("subtitle", rng.choice(languages)))
+    return tracks
+
+
+def generate_library(root: str, count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    for index in range(count):
+        show = f"Show {index // 200:03d}"
+        season = f"Season {(index // 20) % 10 + 1:02d}"
+        dirname = os.path.join(root, show, season)
+        os.makedirs(dirname, exist_ok=True)
+        stem = f"{show} - S{(index // 20) % 10 + 1:02d}E{index % 20 + 1:02d}"
+        extension = rng.choice([".mkv", ".mkv", ".mp4", ".avi"])
+        tracks = random_tracks(rng)
+        if extension == ".mkv":
+            data = make_mkv(tracks)
+        elif extension == ".mp4":
+            data = make_mp4(tracks, moov_at_end=rng.random() < 0.3)
+        else:
+            data = make_avi(tracks)
+        path = os.path.join(dirname, stem + extension)
+        with open(path, "wb") as f:
+            f.write(data)
+        paths.append(path)
+        if extension != ".mkv":
+            for language in rng.sample(["eng", "fre", ""], rng.randint(0, 2)):
+                suffix = f".{language}.srt" if language else ".srt"
+                with open(os.path.join(dirname, stem + suffix), "w") as f:
+                    f.write(srt_body)
+    return paths
+
+
+def timed(phase: Callable[[], object]) -> Dict[str, object]:
+    from metrics import reset, summary
+
+    reset()
+    start = time.perf_counter()
+    phase()
+    elapsed = time.perf_counter() - start
+    stages = {
+        stage: {"count": values["count"], "sum": values["sum"]}
+        for stage, values in summary().items()
+    }
+    return {"seconds": elapsed, "stages": stages}
+
+
+def use_database(workdir: str, name: str) -> None:
+    from cache import close_cache
+    from sqlite import newdb
+
+    close_cache()
+    db_path = os.path.join(workdir, f"{name}.db")
+    newdb(db_path)
+    os.environ["DB_PATH"] = db_path
+
+
+def run_size(
+    count: int, workers: int, threads: int, samples: int, seed: int
+) -> Dict[str, object]:
+    from app import check_audio_subtitle, reconcile, search
+    from cache import close_cache
+
+    workdir = tempfile.mkdtemp(prefix="videoscanner-bench-")
+    try:
+        library = os.path.join(workdir, "library")
+        start = time.perf_counter()
+        paths = generate_library(library, count, seed)
+        generate_seconds = time.perf_counter() - start
+        os.environ["PROBE_CACHE_PATH"] = os.path.join(workdir, "cache.sqlite")
+
+        phases = {}
+        use_database(workdir, "cold")
+        phases["search_cold"] = timed(lambda: search(library, threads))
+        phases["reconcile_cold"] = timed(lambda: reconcile(workers))
+        phases["search_unchanged"] = timed(lambda: search(library, threads))
+        phases["reconcile_unchanged"] = timed(lambda: reconcile(workers))
+
+        use_database(workdir, "rebuild")
+        phases["search_rebuild"] = timed(lambda: search(library, threads))
+        phases["reconcile_rebuild_cached"] = timed(lambda: reconcile(workers))
+
+        use_database(workdir, "single")
+        os.environ["PROBE_CACHE_PATH"] = os.path.join(workdir, "cold.sqlite")
+        sample = random.Random(seed).sample(paths, min(samples, len(paths)))
+
+        def single_file_scans() -> None:
+            for path in sample:
+                check_audio_subtitle(path)
+            close_cache()
+
+        phases["single_file"] = timed(single_file_scans)
+        phases["single_file"]["per_file"] = phases["single_file"][
+            "seconds"
+        ] / max(1, len(sample))
+
+        return {
+            "files": count,
+            "generate_seconds": generate_seconds,
+            "phases": phases,
+        }
+    finally:
+        close_cache()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=parent_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark search, reconcile and single-file scans "
+        "against a generated synthetic library."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=str,
+        help="Comma-separated library sizes in thousands of files. "
+        "(default: 1,5)",
+        default="1,5",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, help="Reconcile workers.", default=1
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, help="Search threads.", default=8
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        help="Files timed in the single-file phase. (default: 100)",
+        default=100,
+    )
+    parser.add_argument(
+        "--seed", type=int, help="Library generator seed.", default=0
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Path of the JSON results file.",
+        default=os.path.join(
+            os.getenv("LOCAL_TEMP", "./scratch"), "bench_results.json"
+        ),
+    )
+    args = parser.parse_args()
+
+    os.environ["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "WARNING")
+    from logger import set_log_level
+
+    set_log_level(os.environ["LOG_LEVEL"])
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workers": args.workers,
+        "threads": args.threads,
+        "seed": args.seed,
+        "sizes": [],
+    }
+    for size in args.sizes.split(","):
+        count = int(float(size) * 1000)
+        result = run_size(
+            count, args.workers, args.threads, args.samples, args.seed
+        )
+        results["sizes"].append(result)
+        summary = ", ".join(
+            f"{phase}={values['seconds']:.2f}s"
+            for phase, values in result["phases"].items()
+        )
+        print(f"{count} files: {summary}")
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,122 @@
+import atexit
+import json
+import os
+import time
+
+
+from typing import Dict, List, Optional
+
+
+from logger import log
+from sqlite import connect, DBSession, SQLiteConn
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+reader: Optional[SQLiteConn] = None
+writer: Optional[DBSession] = None
+stores_since_eviction = 0
+
+
+# Functions
+
+
+def cache_path() -> str:
+    path = os.getenv("PROBE_CACHE_PATH")
+    if path:
+        return path
+    db_dir = os.path.dirname(os.path.abspath(os.getenv("DB_PATH", ".")))
+    return os.path.join(db_dir, "probe_cache.sqlite")
+
+
+def create_cache(connection: SQLiteConn) -> None:
+    connection.execute("PRAGMA busy_timeout = 30000")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS probe_cache ("
+        "key TEXT PRIMARY KEY, tracks TEXT NOT NULL, last_used REAL)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_probe_cache_last_used "
+        "ON probe_cache (last_used)"
+    )
+    connection.commit()
+
+
+def lookup(key: str) -> Optional[List[Dict[str, str]]]:
+    global reader
+    try:
+        if reader is None:
+            reader = connect(cache_path())
+            create_cache(reader)
+        row = reader.execute(
+            "SELECT tracks FROM probe_cache WHERE key = ?", [key]
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+    except Exception as e:
+        error_info = f"[Failed to read probe cache]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return None
+
+
+def open_writer() -> DBSession:
+    global writer
+    if writer is None:
+        writer = DBSession(
+            cache_path(),
+            batch_size=int(os.getenv("DB_BATCH_SIZE", "500")),
+            batch_ms=int(os.getenv("DB_BATCH_MS", "1000")),
+        )
+        create_cache(writer.connection)
+        atexit.register(close_cache)
+    return writer
+
+
+def store(key: str, tracks: List[Dict[str, str]]) -> None:
+    global stores_since_eviction
+    try:
+        open_writer().execute(
+            "INSERT OR REPLACE INTO probe_cache (key, tracks, last_used) "
+            "VALUES (?, ?, ?)",
+            [key, json.dumps(tracks), time.time()],
+        )
+        stores_since_eviction += 1
+        if stores_since_eviction >= 1000:
+            evict()
+    except Exception as e:
+        error_info = f"[Failed to write probe cache]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+
+
+def touch(key: str) -> None:
+    try:
+        open_writer().execute(
+            "UPDATE probe_cache SET last_used = ? WHERE key = ?",
+            [time.time(), key],
+        )
+    except Exception as e:
+        error_info = f"[Failed to write probe cache]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+
+
+def evict(max_entries: Optional[int] = None) -> None:
+    global stores_since_eviction
+    if max_entries is None:
+        max_entries = int(os.getenv("PROBE_CACHE_MAX_ENTRIES", "1000000"))
+    stores_since_eviction = 0
+    open_writer().execute(
+        "DELETE FROM probe_cache WHERE key IN ("
+        "SELECT key FROM probe_cache ORDER BY last_used DESC "
+        "LIMIT -1 OFFSET ?)",
+        [max_entries],
+    )
+
+
+def close_cache() -> None:
+    global reader, writer
+    if writer is not None:
+        writer.close()
+        writer = None
+    if reader is not None:
+        reader.close()
+        reader = None
@@ -0,0 +1,46 @@
+import json
+import os
+import time
+
+
+from typing import Dict, Optional
+
+
+from logger import log
+from sqlite import DBSession
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+checkpoint_seconds = float(os.getenv("CHECKPOINT_SECONDS", "30"))
+
+
+# Functions
+
+
+def load_checkpoint(session: DBSession, name: str) -> Optional[Dict]:
+    try:
+        rows = session.raw_query(
+            "SELECT state FROM checkpoints WHERE name = ?", [name]
+        )
+        return json.loads(rows[0][0]) if rows else None
+    except Exception as e:
+        error_info = f"[Failed to load checkpoint {name}]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return None
+
+
+def save_checkpoint(session: DBSession, name: str, state: Dict) -> bool:
+    # Written after, and committed together with, the rows it covers.
+    session.execute(
+        "INSERT OR REPLACE INTO checkpoints (name, state, updated) "
+        "VALUES (?, ?, ?)",
+        [name, json.dumps(state), time.time()],
+    )
+    return session.commit()
+
+
+def clear_checkpoint(session: DBSession, name: str) -> bool:
+    session.execute("DELETE FROM checkpoints WHERE name = ?", [name])
+    return session.commit()
@@ -0,0 +1,152 @@
+import os
+
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+from logger import log
+from scheduler import ordered
+from sqlite import open_session, DBSession
+from utils import content_key, full_hash, normalize_path
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+sample_blocks = int(os.getenv("HASH_SAMPLE_BLOCKS", "16"))
+collision_sizes = (
+    "SELECT size FROM media WHERE size IS NOT NULL "
+    "GROUP BY size HAVING COUNT(*) > 1"
+)
+collision_hashes = (
+    "SELECT content_hash FROM media WHERE content_hash IS NOT NULL "
+    "GROUP BY content_hash HAVING COUNT(*) > 1"
+)
+
+
+# Functions
+
+
+def sampled_hash(og_filepath: str, size: int) -> str:
+    return content_key(og_filepath, size, samples=sample_blocks)
+
+
+def whole_hash(og_filepath: str, size: int) -> str:
+    return full_hash(og_filepath)
+
+
+def hash_records(
+    records: List[tuple], hasher: Callable[[str, int], str], threads: int
+) -> Iterator[Tuple[int, Optional[str]]]:
+    def hash_record(record: tuple) -> Tuple[int, Optional[str]]:
+        record_id, filepath, _, size, mtime = record
+        og_filepath, _ = normalize_path(filepath)
+        try:
+            stat = os.stat(og_filepath)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                # Hashed after the next probe records the new fingerprint.
+                return record_id, None
+            return record_id, hasher(og_filepath, size)
+        except OSError as e:
+            error_info = f"[Skipping unreadable file {filepath}]:{zerr(e)}"
+            log(error_info, "WARNING")
+            return record_id, None
+
+    records = [record for _, record in ordered(records)]
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        yield from executor.map(hash_record, records)
+
+
+def hash_contents(threads: int = 8) -> Optional[Dict[str, int]]:
+    from app import dedupe
+
+    session = None
+    try:
+        session = open_session()
+    except Exception as e:
+        error_info = f"[Failed to connect to database for hashing]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    counts = {"sampled": 0, "full": 0}
+    try:
+        # A file whose size no other file shares cannot have a copy, so its
+        # key is the size alone and it is never read.
+        session.execute(
+            "UPDATE media SET content_hash = size || ':' "
+            "WHERE content_hash IS NULL AND size IS NOT NULL "
+            f"AND size NOT IN ({collision_sizes})"
+        )
+        records = session.raw_query(
+            "SELECT id, filepath, inode, size, mtime FROM media "
+            f"WHERE size IN ({collision_sizes}) "
+            "AND (content_hash IS NULL OR content_hash = size || ':')"
+        )
+        for record_id, value in hash_records(records, sampled_hash, threads):
+            if value is not None:
+                session.update(
+                    "media", {"content_hash": value}, {"id": record_id}
+                )
+                counts["sampled"] += 1
+
+        # Only files whose sampled hashes collide are read in full.
+        records = session.raw_query(
+            "SELECT id, filepath, inode, size, mtime FROM media "
+            f"WHERE full_hash IS NULL AND content_hash IN ({collision_hashes})"
+        )
+        for record_id, value in hash_records(records, whole_hash, threads):
+            if value is not None:
+                session.update(
+                    "media", {"full_hash": value}, {"id": record_id}
+                )
+                counts["full"] += 1
+        session.commit()
+        log(
+            f"[Hash]:{counts['sampled']} files sampled, "
+            f"{counts['full']} read in full",
+            "INFO",
+            success=True,
+        )
+    except Exception as e:
+        error_info = f"[Failed to hash media contents]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    finally:
+        session.close()
+    dedupe()
+    return counts
+
+
+def content_duplicates(
+    session: DBSession,
+    og_filepath: str,
+    record: Tuple[int, str, Optional[str]],
+) -> List[str]:
+    record_id, content_hash, own_hash = record
+    candidates = session.raw_query(
+        "SELECT id, filepath, full_hash FROM media "
+        "WHERE content_hash = ? AND id != ?",
+        [content_hash, record_id],
+    )
+    duplicates = []
+    for candidate_id, filepath, candidate_hash in candidates:
+        try:
+            if own_hash is None:
+                own_hash = full_hash(og_filepath)
+                session.update(
+                    "media", {"full_hash": own_hash}, {"id": record_id}
+                )
+            if candidate_hash is None:
+                candidate_hash = full_hash(normalize_path(filepath)[0])
+                session.update(
+                    "media",
+                    {"full_hash": candidate_hash},
+                    {"id": candidate_id},
+                )
+        except OSError as e:
+            error_info = f"[Failed to confirm duplicate {filepath}]:{zerr(e)}"
+            log(error_info, "WARNING")
+            continue
+        if candidate_hash == own_hash:
+            duplicates.append(filepath)
+    return duplicates
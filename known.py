@@ -0,0 +1,85 @@
+import hashlib
+import os
+
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+
+from sqlite import DBSession
+from utils import path_range
+
+# Function specific variables and aliases
+
+
+# id, complete, size, mtime, inode, misc
+KnownRecord = Tuple[
+    int, Optional[str], Optional[int], Optional[int], Optional[int], str
+]
+hashed_threshold = int(os.getenv("KNOWN_PATHS_HASHED", "1000000"))
+fetch_size = 10000
+
+
+# Classes
+
+
+class KnownPaths:
+    def __init__(
+        self,
+        session: DBSession,
+        top_level_folder: str,
+        keep: Optional[Callable[[str], bool]] = None,
+    ) -> None:
+        values = list(path_range(top_level_folder))
+        count = session.raw_query(
+            "SELECT COUNT(*) FROM media WHERE filepath > ? AND filepath < ?",
+            values,
+        )[0][0]
+        # Past the threshold paths are kept as 8-byte digests rather than
+        # strings, which cuts the set to a fraction of its size.
+        self.hashed = count > hashed_threshold
+        self.records: Dict[Union[str, bytes], KnownRecord] = {}
+        cursor = session.connection.execute(
+            "SELECT filepath, id, complete, size, mtime, inode, misc "
+            "FROM media WHERE filepath > ? AND filepath < ?",
+            values,
+        )
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                if keep is not None and not keep(row[0]):
+                    continue
+                self.records[self.key(row[0])] = row[1:]
+
+    def key(self, filepath: str) -> Union[str, bytes]:
+        if not self.hashed:
+            return filepath
+        return hashlib.blake2b(
+            filepath.encode("utf-8"), digest_size=8
+        ).digest()
+
+    def take(self, filepath: str) -> Optional[KnownRecord]:
+        # Records left after the walk are the files that have gone missing.
+        return self.records.pop(self.key(filepath), None)
+
+    def missing_ids(self) -> List[int]:
+        return [record[0] for record in self.records.values()]
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+# Functions
+
+
+def missing_paths(session: DBSession, ids: List[int]) -> Iterator[str]:
+    for start in range(0, len(ids), 500):
+        chunk = ids[start : start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        for row in session.raw_query(
+            f"SELECT filepath FROM media WHERE id IN ({placeholders}) "
+            "ORDER BY filepath",
+            chunk,
+        ):
+            yield row[0]
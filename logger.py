@@ -1,14 +1,40 @@
+import atexit
 import os
+import queue
 import re
+import threading
 
 from datetime import datetime
-from icecream import ic
-from typing import Optional
+from typing import Dict, List, Optional, TextIO, Tuple
 
 
-def get_log_path() -> str:
+levels: Dict[str, int] = {
+    "DEBUG": 10,
+    "INFO": 20,
+    "WARNING": 30,
+    "ERROR": 40,
+    "CRITICAL": 50,
+}
+threshold = levels.get(os.getenv("LOG_LEVEL", "DEBUG").upper(), 10)
+LogRecord = Tuple[datetime, str, str, bool]
+log_paths: Dict[str, str] = {}
+log_queue: Optional["queue.Queue[Optional[LogRecord]]"] = None
+log_writer: Optional[threading.Thread] = None
+
+
+def ic(message: str) -> None:
+    # icecream is slow to import and only needed for console output.
+    from icecream import ic as icecream
+
+    icecream(message)
+
+
+def get_log_path(today: Optional[str] = None) -> str:
+    if today is None:
+        today = str(fix_datetime(datetime.utcnow())).split(" ")[0]
+    if today in log_paths:
+        return log_paths[today]
     log_dir = os.path.join(os.getcwd(), os.getenv("LOG_DIR", ".logs"))
-    today = str(fix_datetime(datetime.utcnow())).split(" ")[0]
     time_stamp = re.sub(r"\W+", "", str(today))
 
     if os.path.exists(log_dir) and not os.path.isdir(log_dir):
@@ -20,7 +46,36 @@ def get_log_path() -> str:
         except OSError:
             raise Exception(f"Failed to create log directory at [{log_dir}]")
 
-    return os.path.join(log_dir, f"{time_stamp}.log")
+    log_paths[today] = os.path.join(log_dir, f"{time_stamp}.log")
+    return log_paths[today]
+
+
+def set_log_level(level: str) -> None:
+    global threshold
+    threshold = levels.get(level.upper(), threshold)
+
+
+def log_enabled(level: str) -> bool:
+    return levels.get(level, 50) >= threshold
+
+
+def format_record(record: LogRecord) -> str:
+    now, level, log_message, success = record
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if success:
+        return f"[{stamp}] [INFO] Success: {log_message}\n"
+    return f"[{stamp}] [{level}] Error: {log_message}\n"
+
+
+def open_log_file(now: datetime) -> TextIO:
+    today = now.strftime("%Y-%m-%d")
+    log_file = get_log_path(today)
+    is_new_file = not os.path.exists(log_file)
+    handle = open(log_file, "a")
+    if is_new_file:
+        stamp = now.strftime("%Y-%m-%d %H:%M:%S.%f")
+        handle.write(f"[{stamp}] ***START_OF_LOG for {today}***.\n")
+    return handle
 
 
 def log(
@@ -29,26 +84,92 @@ def log(
     success: bool = False,
     console: bool = False,
 ) -> None:
+    if levels.get(level, 50) < threshold:
+        return
     console = True if os.environ.get("FORCE_DEBUG") == "True" else console
-    today = str(fix_datetime(datetime.utcnow())).split(" ")[0]
-    now = fix_datetime(datetime.utcnow(), milliseconds=True)
+    record = (datetime.utcnow(), level, log_message, success)
 
     if console:
-        ic(f"[{now}] {level}: {log_message}")
+        ic(f"[{record[0]}] {level}: {log_message}")
+
+    if log_queue is not None:
+        log_queue.put(record)
+        return
 
     try:
-        log_file = get_log_path()
-        is_new_file = not os.path.exists(log_file)
-
-        with open(log_file, "a") as f:
-            if is_new_file:
-                f.write(f"[{now}] ***START_OF_LOG for {today}***.\n")
-            if success:
-                f.write(f"[{now}] [INFO] Success: {log_message}\n")
-            else:
-                f.write(f"[{now}] [{level}] Error: {log_message}\n")
+        with open_log_file(record[0]) as f:
+            f.write(format_record(record))
     except Exception as e:
-        ic(f"[{now}] [{level}] Error: {log_message} | Exception: {e}")
+        ic(f"[{record[0]}] [{level}] Error: {log_message} | Exception: {e}")
+
+
+def write_queued_records(
+    records: "queue.Queue[Optional[LogRecord]]", batch_size: int
+) -> None:
+    handle: Optional[TextIO] = None
+    current_day = None
+    running = True
+    while running:
+        batch: List[Optional[LogRecord]] = [records.get()]
+        while len(batch) < batch_size:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        for record in batch:
+            if record is None:
+                running = False
+                continue
+            try:
+                day = record[0].strftime("%Y-%m-%d")
+                if handle is None or day != current_day:
+                    if handle is not None:
+                        handle.close()
+                    handle = open_log_file(record[0])
+                    current_day = day
+                handle.write(format_record(record))
+            except Exception as e:
+                ic(f"{format_record(record).strip()} | Exception: {e}")
+        if handle is not None:
+            handle.flush()
+    if handle is not None:
+        handle.close()
+
+
+def start_background_logging(batch_size: int = 256) -> None:
+    global log_queue, log_writer
+    if log_queue is not None:
+        return
+    log_queue = queue.Queue()
+    log_writer = threading.Thread(
+        target=write_queued_records,
+        args=(log_queue, batch_size),
+        name="log-writer",
+        daemon=True,
+    )
+    log_writer.start()
+    atexit.register(stop_background_logging)
+
+
+def stop_background_logging() -> None:
+    global log_queue, log_writer
+    if log_queue is None:
+        return
+    log_queue.put(None)
+    log_writer.join()
+    log_queue = None
+    log_writer = None
+
+
+def reset_after_fork() -> None:
+    # A forked child (a probe worker) has the queue but not the writer
+    # thread, so it logs synchronously instead.
+    global log_queue, log_writer
+    log_queue = None
+    log_writer = None
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
 
 
 def fix_datetime(
@@ -0,0 +1,161 @@
+import heapq
+import json
+import os
+import threading
+import time
+
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+from logger import log
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+slowest_kept = 10
+stages: Dict[str, Dict[str, Union[int, float, List[int]]]] = {}
+slowest: Dict[str, List[Tuple[float, str]]] = {}
+lock = threading.Lock()
+started = time.time()
+
+
+# Functions
+
+
+def observe(stage: str, seconds: float, item: Optional[str] = None) -> None:
+    with lock:
+        stats = stages.get(stage)
+        if stats is None:
+            stats = {"count": 0, "sum": 0.0, "buckets": [0] * len(buckets)}
+            stages[stage] = stats
+        stats["count"] += 1
+        stats["sum"] += seconds
+        for index, bound in enumerate(buckets):
+            if seconds <= bound:
+                stats["buckets"][index] += 1
+                break
+        if item is not None:
+            heap = slowest.setdefault(stage, [])
+            if len(heap) < slowest_kept:
+                heapq.heappush(heap, (seconds, item))
+            elif seconds > heap[0][0]:
+                heapq.heapreplace(heap, (seconds, item))
+
+
+@contextmanager
+def timer(stage: str, item: Optional[str] = None) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, item)
+
+
+def reset() -> None:
+    global started
+    with lock:
+        stages.clear()
+        slowest.clear()
+        started = time.time()
+
+
+def summary() -> Dict[str, Dict[str, object]]:
+    with lock:
+        result = {}
+        for stage, stats in sorted(stages.items()):
+            cumulative = 0
+            histogram = {}
+            for bound, count in zip(buckets, stats["buckets"]):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            histogram["+Inf"] = stats["count"]
+            result[stage] = {
+                "count": stats["count"],
+                "sum": stats["sum"],
+                "mean": stats["sum"] / stats["count"],
+                "buckets": histogram,
+                "slowest": [
+                    {"item": item, "seconds": seconds}
+                    for seconds, item in sorted(
+                        slowest.get(stage, []), reverse=True
+                    )
+                ],
+            }
+        return result
+
+
+def escape_label(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def prometheus_text() -> str:
+    stats = summary()
+    lines = [
+        "# HELP videoscanner_stage_seconds Time spent per scan stage.",
+        "# TYPE videoscanner_stage_seconds histogram",
+    ]
+    for stage, values in stats.items():
+        for bound, count in values["buckets"].items():
+            lines.append(
+                f'videoscanner_stage_seconds_bucket{{stage="{stage}",'
+                f'le="{bound}"}} {count}'
+            )
+        lines.append(
+            f'videoscanner_stage_seconds_sum{{stage="{stage}"}} '
+            f'{values["sum"]}'
+        )
+        lines.append(
+            f'videoscanner_stage_seconds_count{{stage="{stage}"}} '
+            f'{values["count"]}'
+        )
+    lines += [
+        "# HELP videoscanner_slowest_seconds Slowest items per stage.",
+        "# TYPE videoscanner_slowest_seconds gauge",
+    ]
+    for stage, values in stats.items():
+        for entry in values["slowest"]:
+            lines.append(
+                f'videoscanner_slowest_seconds{{stage="{stage}",'
+                f'item="{escape_label(entry["item"])}"}} {entry["seconds"]}'
+            )
+    lines += [
+        "# HELP videoscanner_run_start_timestamp_seconds Run start time.",
+        "# TYPE videoscanner_run_start_timestamp_seconds gauge",
+        f"videoscanner_run_start_timestamp_seconds {started}",
+        "# HELP videoscanner_run_end_timestamp_seconds Export time.",
+        "# TYPE videoscanner_run_end_timestamp_seconds gauge",
+        f"videoscanner_run_end_timestamp_seconds {time.time()}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path: str, content: str) -> Optional[bool]:
+    try:
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        return True
+    except Exception as e:
+        error_info = f"[Failed to write metrics to {path}]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return False
+
+
+def write_prometheus(path: str) -> Optional[bool]:
+    return write_atomic(path, prometheus_text())
+
+
+def write_json(path: str) -> Optional[bool]:
+    content = {
+        "started": started,
+        "finished": time.time(),
+        "stages": summary(),
+    }
+    return write_atomic(path, json.dumps(content, indent=2))
@@ -0,0 +1,157 @@
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+
+from utils import language_code
+
+# Function specific variables and aliases
+
+
+EBML_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+SEEK_HEAD_ID = 0x114D9B74
+SEEK_ID = 0x4DBB
+SEEK_ID_ID = 0x53AB
+SEEK_POSITION_ID = 0x53AC
+TRACKS_ID = 0x1654AE6B
+TRACK_ENTRY_ID = 0xAE
+TRACK_TYPE_ID = 0x83
+LANGUAGE_ID = 0x22B59C
+LANGUAGE_IETF_ID = 0x22B59D
+CODEC_ID_ID = 0x86
+
+track_kinds = {1: "video", 2: "audio", 17: "subtitle"}
+max_top_level_elements = 64
+max_element_size = 16 * 1024 * 1024
+
+
+# Functions
+
+
+def read_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int]:
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError(f"Invalid EBML variable-length integer at {pos}")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1 : pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = -1
+    return value, pos + length
+
+
+def read_header(stream: BinaryIO) -> Tuple[int, int]:
+    data = stream.read(12)
+    if len(data) < 2:
+        raise EOFError("Unexpected end of Matroska file")
+    element_id, pos = read_vint(data, 0, keep_marker=True)
+    size, pos = read_vint(data, pos, keep_marker=False)
+    stream.seek(pos - len(data), 1)
+    return element_id, size
+
+
+def iter_children(data: bytes) -> List[Tuple[int, bytes]]:
+    children = []
+    pos = 0
+    while pos < len(data):
+        element_id, pos = read_vint(data, pos, keep_marker=True)
+        size, pos = read_vint(data, pos, keep_marker=False)
+        if size < 0:
+            raise ValueError("Unknown-size element inside a master element")
+        children.append((element_id, data[pos : pos + size]))
+        pos += size
+    return children
+
+
+def read_payload(stream: BinaryIO, size: int) -> bytes:
+    if size < 0 or size > max_element_size:
+        raise ValueError(f"Refusing to read Matroska element of {size} bytes")
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("Truncated Matroska element")
+    return data
+
+
+def parse_tracks(data: bytes) -> List[Dict[str, str]]:
+    tracks = []
+    for element_id, entry in iter_children(data):
+        if element_id != TRACK_ENTRY_ID:
+            continue
+        kind = None
+        language = None
+        language_ietf = None
+        codec = None
+        for child_id, value in iter_children(entry):
+            if child_id == TRACK_TYPE_ID:
+                kind = track_kinds.get(int.from_bytes(value, "big"))
+            elif child_id == LANGUAGE_ID:
+                language = value.rstrip(b"\x00").decode("ascii", "replace")
+            elif child_id == CODEC_ID_ID:
+                codec = value.rstrip(b"\x00").decode("ascii", "replace")
+            elif child_id == LANGUAGE_IETF_ID:
+                language_ietf = value.rstrip(b"\x00").decode(
+                    "ascii", "replace"
+                )
+        if kind is None:
+            continue
+        if language is None and language_ietf is not None:
+            language = language_code(language_ietf.split("-")[0])
+        tracks.append(
+            {"kind": kind, "language": language or "eng", "codec": codec}
+        )
+    return tracks
+
+
+def find_tracks_position(data: bytes) -> Optional[int]:
+    for element_id, seek in iter_children(data):
+        if element_id != SEEK_ID:
+            continue
+        target = None
+        position = None
+        for child_id, value in iter_children(seek):
+            if child_id == SEEK_ID_ID:
+                target = int.from_bytes(value, "big")
+            elif child_id == SEEK_POSITION_ID:
+                position = int.from_bytes(value, "big")
+        if target == TRACKS_ID and position is not None:
+            return position
+    return None
+
+
+def read_tracks(og_filepath: str) -> Optional[List[Dict[str, str]]]:
+    try:
+        with open(og_filepath, "rb") as stream:
+            element_id, size = read_header(stream)
+            if element_id != EBML_ID:
+                return None
+            stream.seek(size, 1)
+            element_id, _ = read_header(stream)
+            if element_id != SEGMENT_ID:
+                return None
+            segment_start = stream.tell()
+
+            for _ in range(max_top_level_elements):
+                element_id, size = read_header(stream)
+                if element_id == TRACKS_ID:
+                    return parse_tracks(read_payload(stream, size))
+                if element_id == SEEK_HEAD_ID:
+                    position = find_tracks_position(
+                        read_payload(stream, size)
+                    )
+                    if position is not None:
+                        stream.seek(segment_start + position)
+                        element_id, size = read_header(stream)
+                        if element_id == TRACKS_ID:
+                            return parse_tracks(read_payload(stream, size))
+                        return None
+                    continue
+                if size < 0:
+                    return None
+                stream.seek(size, 1)
+    except (EOFError, IndexError, OSError, ValueError):
+        return None
+    return None
@@ -0,0 +1,157 @@
+import mmap
+
+
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+# Function specific variables and aliases
+
+
+handler_kinds = {
+    b"soun": "audio",
+    b"vide": "video",
+    b"sbtl": "subtitle",
+    b"subt": "subtitle",
+    b"text": "subtitle",
+    b"clcp": "subtitle",
+}
+mac_languages = {
+    0: "eng",
+    1: "fre",
+    2: "ger",
+    3: "ita",
+    4: "dut",
+    5: "swe",
+    6: "spa",
+    7: "dan",
+    8: "por",
+    9: "nor",
+    10: "heb",
+    11: "jpn",
+    12: "ara",
+    13: "fin",
+    14: "gre",
+    19: "chi",
+    23: "kor",
+    32: "rus",
+}
+
+
+# Functions
+
+
+def iter_boxes(
+    view: mmap.mmap, start: int, end: int
+) -> Iterator[Tuple[bytes, int, int]]:
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(view[pos : pos + 4], "big")
+        box_type = view[pos + 4 : pos + 8]
+        header = 8
+        if size == 1:
+            size = int.from_bytes(view[pos + 8 : pos + 16], "big")
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError(f"Invalid {box_type!r} box at offset {pos}")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def find_box(
+    view: mmap.mmap, start: int, end: int, box_type: bytes
+) -> Optional[Tuple[int, int]]:
+    for child_type, child_start, child_end in iter_boxes(view, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def unpack_language(packed: int) -> str:
+    if packed < 0x400:
+        return mac_languages.get(packed, "und")
+    return "".join(
+        chr(((packed >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0)
+    )
+
+
+def sample_format(view: mmap.mmap, start: int, end: int) -> Optional[str]:
+    stbl = find_box(view, start, end, b"stbl")
+    if stbl is None:
+        return None
+    stsd = find_box(view, stbl[0], stbl[1], b"stsd")
+    if stsd is None or stsd[1] - stsd[0] < 16:
+        return None
+    return view[stsd[0] + 12 : stsd[0] + 16].decode("latin-1").strip()
+
+
+def parse_trak(
+    view: mmap.mmap, start: int, end: int
+) -> Tuple[Optional[int], Optional[Dict[str, str]], Set[int]]:
+    track_id = None
+    track = None
+    chapters: Set[int] = set()
+    for box_type, box_start, box_end in iter_boxes(view, start, end):
+        if box_type == b"tkhd":
+            offset = 20 if view[box_start] == 1 else 12
+            track_id = int.from_bytes(
+                view[box_start + offset : box_start + offset + 4], "big"
+            )
+        elif box_type == b"tref":
+            chap = find_box(view, box_start, box_end, b"chap")
+            if chap is not None:
+                for pos in range(chap[0], chap[1] - 3, 4):
+                    chapters.add(int.from_bytes(view[pos : pos + 4], "big"))
+        elif box_type == b"mdia":
+            kind = None
+            language = "und"
+            codec = None
+            for child_type, child_start, child_end in iter_boxes(
+                view, box_start, box_end
+            ):
+                if child_type == b"hdlr":
+                    kind = handler_kinds.get(
+                        view[child_start + 8 : child_start + 12]
+                    )
+                elif child_type == b"mdhd":
+                    pos = child_start + (32 if view[child_start] == 1 else 20)
+                    language = unpack_language(
+                        int.from_bytes(view[pos : pos + 2], "big")
+                    )
+                elif child_type == b"minf":
+                    codec = sample_format(view, child_start, child_end)
+            if kind is not None:
+                track = {"kind": kind, "language": language, "codec": codec}
+    return track_id, track, chapters
+
+
+def read_tracks(og_filepath: str) -> Optional[List[Dict[str, str]]]:
+    try:
+        with open(og_filepath, "rb") as stream:
+            with mmap.mmap(
+                stream.fileno(), 0, access=mmap.ACCESS_READ
+            ) as view:
+                moov = find_box(view, 0, len(view), b"moov")
+                if moov is None:
+                    return None
+                tracks = []
+                chapters: Set[int] = set()
+                for box_type, box_start, box_end in iter_boxes(
+                    view, moov[0], moov[1]
+                ):
+                    if box_type != b"trak":
+                        continue
+                    track_id, track, chapter_ids = parse_trak(
+                        view, box_start, box_end
+                    )
+                    chapters.update(chapter_ids)
+                    if track is not None:
+                        tracks.append((track_id, track))
+                return [
+                    track
+                    for track_id, track in tracks
+                    if track_id not in chapters
+                ]
+    except (IndexError, OSError, ValueError):
+        return None
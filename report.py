@@ -0,0 +1,138 @@
+import csv
+import json
+import os
+import sys
+
+
+from typing import Dict, List, Optional, Sequence, TextIO, Tuple
+
+
+from logger import log
+from sqlite import close, connect
+from utils import path_range
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+# Uncorrelated, so the set of files with English subtitles is built once
+# and probed per row, whatever indexes or statistics the database has.
+missing_eng_subs = (
+    "m.id NOT IN (SELECT media_id FROM tracks "
+    "WHERE kind = 'subtitle' AND language = 'eng')"
+)
+# Every report except the rollup is ordered by filepath, which the UNIQUE
+# index on filepath returns without a sort, so rows stream as they are read.
+reports: Dict[str, Tuple[List[str], str]] = {
+    "incomplete": (
+        ["id", "filepath", "audio", "subs", "misc"],
+        "SELECT m.id, m.filepath, m.audio, m.subs, m.misc FROM media AS m "
+        "WHERE m.complete IS NOT 'True' {where} ORDER BY m.filepath",
+    ),
+    "missing-eng-subs": (
+        ["id", "filepath", "audio", "subs"],
+        "SELECT m.id, m.filepath, m.audio, m.subs FROM media AS m "
+        f"WHERE {missing_eng_subs} {{where}} ORDER BY m.filepath",
+    ),
+    "duplicates": (
+        ["id", "filepath", "duplicate"],
+        "SELECT m.id, m.filepath, m.duplicate FROM media AS m "
+        "WHERE m.duplicate IS NOT NULL {where} ORDER BY m.filepath",
+    ),
+    "sidecar-only": (
+        ["id", "filepath", "misc"],
+        "SELECT m.id, m.filepath, m.misc FROM media AS m "
+        "WHERE EXISTS (SELECT 1 FROM tracks AS t WHERE t.media_id = m.id "
+        "AND t.kind = 'subtitle' AND t.source = 'sidecar') "
+        "AND NOT EXISTS (SELECT 1 FROM tracks AS t WHERE t.media_id = m.id "
+        "AND t.kind = 'subtitle' AND t.source = 'embedded') "
+        "{where} ORDER BY m.filepath",
+    ),
+    "dirs": (
+        ["directory", "files", "complete", "missing_eng_subs", "duplicates"],
+        "SELECT rtrim(m.filepath, replace(m.filepath, '/', '')) AS directory, "
+        "COUNT(*), SUM(m.complete IS 'True'), "
+        f"SUM({missing_eng_subs}), SUM(m.duplicate IS NOT NULL) "
+        "FROM media AS m WHERE 1 {where} GROUP BY directory "
+        "ORDER BY directory",
+    ),
+}
+fetch_size = 1000
+max_column_width = 80
+
+
+# Functions
+
+
+def write_table(
+    stream: TextIO, columns: List[str], rows: Sequence[Sequence]
+) -> List[int]:
+    # Widths come from the first page only, so output can start before the
+    # last row has been read.
+    widths = [len(column) for column in columns]
+    for row in rows:
+        for index, value in enumerate(row):
+            width = len("" if value is None else str(value))
+            width = min(width, max_column_width)
+            widths[index] = max(widths[index], width)
+    stream.write(
+        "  ".join(c.ljust(w) for c, w in zip(columns, widths)).rstrip() + "\n"
+    )
+    stream.write("  ".join("-" * w for w in widths) + "\n")
+    return widths
+
+
+def format_row(row: Sequence, widths: List[int]) -> str:
+    values = ["" if value is None else str(value) for value in row]
+    return "  ".join(v.ljust(w) for v, w in zip(values, widths)).rstrip()
+
+
+def report(
+    kind: str,
+    output_format: str = "table",
+    output: Optional[str] = None,
+    under: Optional[str] = None,
+) -> Optional[int]:
+    connection = None
+    stream = None
+    try:
+        columns, query = reports[kind]
+        values: List[str] = []
+        where = ""
+        if under:
+            where = "AND m.filepath > ? AND m.filepath < ?"
+            values = list(path_range(under))
+        connection = connect(os.getenv("DB_PATH"))
+        cursor = connection.execute(query.format(where=where), values)
+
+        stream = open(output, "w", newline="") if output else sys.stdout
+        writer = csv.writer(stream) if output_format == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+        widths = None
+        count = 0
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            if output_format == "table" and widths is None:
+                widths = write_table(stream, columns, rows)
+            for row in rows:
+                if writer is not None:
+                    writer.writerow(row)
+                elif output_format == "jsonl":
+                    stream.write(json.dumps(dict(zip(columns, row))) + "\n")
+                else:
+                    stream.write(format_row(row, widths) + "\n")
+            count += len(rows)
+        stream.flush()
+        return count
+    except Exception as e:
+        error_info = f"[Failed to write {kind} report]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return None
+    finally:
+        if stream is not None and stream is not sys.stdout:
+            stream.close()
+        if connection is not None:
+            close(connection)
@@ -0,0 +1,105 @@
+import os
+
+
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+
+from utils import normalize_path
+
+# Function specific variables and aliases
+
+
+Record = Tuple[int, str, Optional[int]]
+mount_points: Dict[str, str] = {}
+
+
+# Classes
+
+
+class MountQueue:
+    def __init__(self, limits: Dict[str, int], default_limit: int) -> None:
+        self.limits = limits
+        self.default_limit = max(1, default_limit)
+        self.pending: Dict[str, Deque[Record]] = {}
+        self.running: Dict[str, int] = {}
+        self.order: Deque[str] = deque()
+
+    def add(self, records: Iterable[Record]) -> None:
+        for mount, record in ordered(records):
+            if mount not in self.pending:
+                self.pending[mount] = deque()
+                self.running[mount] = 0
+                self.order.append(mount)
+            self.pending[mount].append(record)
+
+    def take(self) -> Optional[Tuple[str, Record]]:
+        # Round-robin over mounts, so one slow share only ever holds its own
+        # limit of slots. Mounts without a limit split the workers between
+        # the mounts that still have work, so one share cannot fill them all
+        # while another is waiting.
+        active = sum(
+            1 for mount in self.order
+            if self.pending[mount] or self.running[mount]
+        )
+        fair_share = max(1, self.default_limit // max(1, active))
+        for _ in range(len(self.order)):
+            mount = self.order[0]
+            self.order.rotate(-1)
+            limit = self.limits.get(mount, fair_share)
+            if self.pending[mount] and self.running[mount] < limit:
+                self.running[mount] += 1
+                return mount, self.pending[mount].popleft()
+        return None
+
+    def release(self, mount: str) -> None:
+        self.running[mount] -= 1
+
+    def retry(self, mount: str, record: Record) -> None:
+        self.release(mount)
+        self.pending[mount].appendleft(record)
+
+    def __len__(self) -> int:
+        return sum(len(records) for records in self.pending.values())
+
+
+# Functions
+
+
+def mount_point(dirname: str) -> str:
+    visited = []
+    path = dirname
+    while path not in mount_points:
+        if os.path.ismount(path) or os.path.dirname(path) == path:
+            mount_points[path] = path
+            break
+        visited.append(path)
+        path = os.path.dirname(path)
+    for directory in visited:
+        mount_points[directory] = mount_points[path]
+    return mount_points[path]
+
+
+def parse_mount_limits(spec: Optional[str]) -> Dict[str, int]:
+    limits = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        mount, _, limit = item.rpartition("=")
+        limits[os.path.abspath(mount.strip())] = int(limit)
+    return limits
+
+
+def ordered(records: Iterable[Record]) -> List[Tuple[str, Record]]:
+    # Files are read mount by mount and folder by folder, in inode order
+    # where it is known (close to on-disk order on most local filesystems)
+    # and name order otherwise, so spinning disks see mostly sequential
+    # reads and readahead stays useful.
+    keyed = []
+    for record in records:
+        og_filepath, _ = normalize_path(record[1])
+        dirname, name = os.path.split(og_filepath)
+        mount = mount_point(dirname)
+        keyed.append(((mount, dirname, record[2] or 0, name), record))
+    keyed.sort(key=lambda item: item[0])
+    return [(key[0], record) for key, record in keyed]
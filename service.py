@@ -0,0 +1,238 @@
+import ipaddress
+import json
+import os
+import signal
+import socketserver
+import stat
+import threading
+import time
+
+
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+
+from app import scan_file
+from cache import close_cache
+from logger import log
+from sqlite import open_session
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+throughput_window = 60.0
+max_body_bytes = 16 * 1024 * 1024
+
+
+# Classes
+
+
+class ScanQueue:
+    def __init__(self) -> None:
+        self.paths: "OrderedDict[str, None]" = OrderedDict()
+        self.condition = threading.Condition()
+        self.current: Optional[str] = None
+        self.scanned = 0
+        self.failed = 0
+        self.merged = 0
+        self.finished: Deque[float] = deque()
+        self.started = time.time()
+        self.stopping = False
+
+    def add(self, paths: List[str]) -> Tuple[int, int]:
+        added = 0
+        merged = 0
+        with self.condition:
+            for path in paths:
+                path = os.path.abspath(path)
+                # A path being scanned right now is queued again, since the
+                # request may be for a newer version of the file.
+                if path in self.paths:
+                    merged += 1
+                else:
+                    self.paths[path] = None
+                    added += 1
+            self.merged += merged
+            self.condition.notify()
+        return added, merged
+
+    def take(self, timeout: float) -> Optional[str]:
+        with self.condition:
+            if not self.paths and not self.stopping:
+                self.condition.wait(timeout)
+            if not self.paths:
+                return None
+            self.current, _ = self.paths.popitem(last=False)
+            return self.current
+
+    def done(self, failed: bool) -> None:
+        with self.condition:
+            self.current = None
+            if failed:
+                self.failed += 1
+            else:
+                self.scanned += 1
+            now = time.monotonic()
+            self.finished.append(now)
+            while self.finished and self.finished[0] < now - throughput_window:
+                self.finished.popleft()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    def status(self) -> Dict[str, Union[int, float, Optional[str]]]:
+        with self.condition:
+            now = time.monotonic()
+            recent = sum(
+                1 for when in self.finished if when >= now - throughput_window
+            )
+            return {
+                "queue_depth": len(self.paths),
+                "scanning": self.current,
+                "scanned": self.scanned,
+                "failed": self.failed,
+                "merged": self.merged,
+                "files_per_minute": recent * 60.0 / throughput_window,
+                "uptime": time.time() - self.started,
+            }
+
+
+class ScanRequestHandler(BaseHTTPRequestHandler):
+    queue: ScanQueue
+
+    def send_json(self, status: int, content: Dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") == "/status":
+            self.send_json(200, self.queue.status())
+        else:
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/scan":
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > max_body_bytes:
+                raise ValueError(f"Request body of {length} bytes is too big")
+            content = json.loads(self.rfile.read(length) or b"{}")
+            paths = content.get("paths", [])
+            if "path" in content:
+                paths = paths + [content["path"]]
+            if not paths or not all(isinstance(p, str) for p in paths):
+                raise ValueError("Expected a path or a list of paths")
+        except (AttributeError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        added, merged = self.queue.add(paths)
+        self.send_json(202, {"queued": added, "merged": merged})
+
+    def address_string(self) -> str:
+        # Unix socket peers have no address.
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        log(f"[Service]:{self.address_string()} {format % args}", "DEBUG")
+
+
+class UnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+# Functions
+
+
+def scan_queued(queue: ScanQueue) -> None:
+    session = open_session()
+    try:
+        while True:
+            path = queue.take(timeout=1.0)
+            if path is None:
+                if queue.stopping:
+                    break
+                # Idle, so nothing is left waiting for the batch to fill.
+                session.commit()
+                continue
+            failed = True
+            try:
+                failed = "error" in scan_file(path, session)
+            except Exception as e:
+                error_info = f"[Failed to scan {path}]:{zerr(e)}"
+                log(error_info, "CRITICAL")
+            finally:
+                queue.done(failed)
+    finally:
+        session.close()
+        close_cache()
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_server(address: str, queue: ScanQueue) -> socketserver.BaseServer:
+    handler = type("Handler", (ScanRequestHandler,), {"queue": queue})
+    if os.sep in address or address.endswith(".sock"):
+        # Only a stale socket is replaced, so a mistyped path cannot delete
+        # the database or any other file.
+        if os.path.lexists(address):
+            if not stat.S_ISSOCK(os.lstat(address).st_mode):
+                raise ValueError(f"{address} exists and is not a socket")
+            os.unlink(address)
+        return UnixHTTPServer(address, handler)
+    host, _, port = address.rpartition(":")
+    host = host.strip("[]") or "127.0.0.1"
+    # The service scans any path it is sent, so it only listens locally.
+    if not is_loopback(host):
+        raise ValueError(f"{host} is not a loopback address")
+    return ThreadingHTTPServer((host, int(port)), handler)
+
+
+def serve(address: str) -> None:
+    queue = ScanQueue()
+    try:
+        server = create_server(address, queue)
+    except Exception as e:
+        error_info = f"[Failed to listen on {address}]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    writer = threading.Thread(
+        target=scan_queued, args=(queue,), name="scan-writer"
+    )
+    writer.start()
+    # systemd and docker stop with SIGTERM; treat it like Ctrl-C so the
+    # queue is drained and the socket removed.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    log(f"[Service]:Listening on {address}", "INFO", success=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log("[Service]:Stopping", "INFO", success=True)
+    finally:
+        server.server_close()
+        queue.stop()
+        writer.join()
+        if isinstance(server, UnixHTTPServer):
+            os.unlink(address)
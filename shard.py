@@ -0,0 +1,192 @@
+import os
+import zlib
+
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+from logger import log
+from sqlite import close, connect, migrate, SQLiteConn
+from utils import path_range
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+media_columns = [
+    "filepath",
+    "audio",
+    "subs",
+    "embedded",
+    "misc",
+    "duplicate",
+    "complete",
+    "size",
+    "mtime",
+    "inode",
+    "probed_at",
+    "title_key",
+    # Hashes travel with the size and mtime they were taken from, so a
+    # stale target hash never outlives a newer probe.
+    "content_hash",
+    "full_hash",
+]
+# A source row replaces the target row when the target has none, or when
+# it was probed more recently and the file on disk has changed. The inode
+# is left out because it differs between hosts mounting the same share.
+won_query = (
+    "CREATE TEMP TABLE won AS "
+    "SELECT s.id AS src_id, s.filepath AS filepath "
+    "FROM {source_media} AS s LEFT JOIN main.media AS m "
+    "ON m.filepath = s.filepath "
+    "WHERE m.id IS NULL OR ("
+    "s.probed_at IS NOT NULL "
+    "AND (m.probed_at IS NULL OR s.probed_at > m.probed_at) "
+    "AND (m.probed_at IS NULL OR s.size IS NOT m.size "
+    "OR s.mtime IS NOT m.mtime))"
+)
+
+
+# Functions
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    index, count = (int(part) for part in spec.split("/"))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {spec}, expected K/N with 1<=K<=N")
+    return index, count
+
+
+def in_shard(dirname: str, shard: Tuple[int, int]) -> bool:
+    # Hash the folder name rather than its path, so that every host picks
+    # the same folders whatever the library is mounted as.
+    name = os.path.basename(dirname.rstrip("/\\")).encode("utf-8")
+    return zlib.crc32(name) % shard[1] == shard[0] - 1
+
+
+def shard_filters(
+    top_level_folder: str, shard: Optional[Tuple[int, int]]
+) -> Tuple[Optional[Callable[[str], bool]], Optional[Callable[[str], bool]]]:
+    # skip drops other shards' top-level folders from the walk; keep tells
+    # whether a database path belongs to this shard. Loose files in the
+    # library root belong to the first shard.
+    if shard is None:
+        return None, None
+    prefix, _ = path_range(top_level_folder)
+
+    def keep(filepath: str) -> bool:
+        folder, _, rest = filepath[len(prefix) :].partition("/")
+        if not rest:
+            return shard[0] == 1
+        return in_shard(folder.replace("`", "'"), shard)
+
+    skip: Callable[[str], bool] = lambda dirname: (
+        os.path.dirname(dirname) == top_level_folder
+        and not in_shard(dirname, shard)
+    )
+    return skip, keep
+
+
+def merge_database(connection: SQLiteConn, source: str) -> Dict[str, int]:
+    # Sources are other hosts' files, possibly read-only snapshots, so they
+    # are read as they are and never migrated.
+    if not os.path.isfile(source):
+        raise ValueError(f"{source} is not a database file")
+    cursor = connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS src", [source])
+    try:
+        found = {
+            row[1] for row in cursor.execute("PRAGMA src.table_info(media)")
+        }
+        has_tracks = cursor.execute(
+            "SELECT 1 FROM src.sqlite_master "
+            "WHERE type = 'table' AND name = 'tracks'"
+        ).fetchone()
+        if "filepath" not in found or has_tracks is None:
+            raise ValueError(
+                f"{source} predates the tracks table; run a scan against a "
+                "copy of it to upgrade it before merging"
+            )
+        # Columns added by later migrations are read as NULL.
+        source_media = "(SELECT id, {} FROM src.media)".format(
+            ", ".join(
+                column if column in found else f"NULL AS {column}"
+                for column in media_columns
+            )
+        )
+        cursor.execute("BEGIN")
+        cursor.execute("DROP TABLE IF EXISTS temp.won")
+        cursor.execute(won_query.format(source_media=source_media))
+        cursor.execute("CREATE INDEX temp.idx_won_filepath ON won (filepath)")
+        won = cursor.execute("SELECT COUNT(*) FROM won").fetchone()[0]
+        new = cursor.execute(
+            "SELECT COUNT(*) FROM won WHERE filepath NOT IN "
+            "(SELECT filepath FROM main.media)"
+        ).fetchone()[0]
+
+        columns = ", ".join(media_columns)
+        source_columns = ", ".join(f"s.{column}" for column in media_columns)
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in media_columns[1:]
+        )
+        cursor.execute(
+            f"INSERT INTO main.media ({columns}) "
+            f"SELECT {source_columns} FROM won AS w "
+            f"JOIN {source_media} AS s ON s.id = w.src_id WHERE true "
+            f"ON CONFLICT (filepath) DO UPDATE SET {updates}"
+        )
+        cursor.execute(
+            "DELETE FROM main.tracks WHERE media_id IN ("
+            "SELECT m.id FROM won AS w "
+            "JOIN main.media AS m ON m.filepath = w.filepath)"
+        )
+        cursor.execute(
+            "INSERT INTO main.tracks "
+            "(media_id, kind, language, codec, source) "
+            "SELECT m.id, t.kind, t.language, t.codec, t.source "
+            "FROM won AS w "
+            "JOIN src.tracks AS t ON t.media_id = w.src_id "
+            "JOIN main.media AS m ON m.filepath = w.filepath"
+        )
+        cursor.execute("DROP TABLE temp.won")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("DETACH DATABASE src")
+    return {"inserted": new, "updated": won - new}
+
+
+def merge_databases(sources: List[str], db_path: Optional[str] = None):
+    from app import dedupe
+
+    if db_path is None:
+        db_path = os.getenv("DB_PATH")
+    connection = None
+    try:
+        connection = connect(db_path)
+        migrate(connection)
+        for source in sources:
+            if os.path.abspath(source) == os.path.abspath(db_path):
+                continue
+            try:
+                counts = merge_database(connection, source)
+                log(
+                    f"[Merge]:{source}: {counts['inserted']} inserted, "
+                    f"{counts['updated']} updated",
+                    "INFO",
+                    success=True,
+                )
+            except Exception as e:
+                error_info = f"[Failed to merge database {source}]:{zerr(e)}"
+                log(error_info, "CRITICAL")
+    except Exception as e:
+        error_info = f"[Failed to open database for merge]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    finally:
+        if connection is not None:
+            close(connection)
+    # Duplicates can span files found on different hosts.
+    dedupe()
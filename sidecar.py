@@ -0,0 +1,65 @@
+import os
+import re
+
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Function specific variables and aliases
+
+
+index: Dict[str, Tuple[int, Dict[str, List[Tuple[str, str]]]]] = {}
+lang_pattern = re.compile(r"^[A-Za-z]{2,3}(?:-[A-Za-z0-9]{2,8})*$")
+sidecar_flags = {"forced", "sdh", "cc", "hi", "default"}
+
+
+# Functions
+
+
+def build_directory(names: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+    sidecars: Dict[str, List[Tuple[str, str]]] = {}
+    for name in names:
+        parsed = parse_sidecar(name)
+        if parsed is None:
+            continue
+        stem, lang_code = parsed
+        sidecars.setdefault(stem, []).append((lang_code, name))
+    return sidecars
+
+
+def invalidate(dirname: Optional[str] = None) -> None:
+    if dirname is None:
+        index.clear()
+    else:
+        index.pop(dirname, None)
+
+
+def parse_sidecar(name: str) -> Optional[Tuple[str, str]]:
+    if not name.lower().endswith(".srt"):
+        return None
+    parts = name[:-4].split(".")
+    while len(parts) > 1 and parts[-1].lower() in sidecar_flags:
+        parts.pop()
+    lang_code = ""
+    if len(parts) > 1 and lang_pattern.match(parts[-1]):
+        lang_code = parts.pop()
+    return ".".join(parts), lang_code
+
+
+def prime_directory(dirname: str, mtime_ns: int, names: Iterable[str]) -> None:
+    index[dirname] = (mtime_ns, build_directory(names))
+
+
+def sidecars_for(
+    og_filepath: str, revalidate: bool = True
+) -> List[Tuple[str, str]]:
+    dirname = os.path.dirname(og_filepath)
+    stem = os.path.splitext(os.path.basename(og_filepath))[0]
+    cached = index.get(dirname)
+    if cached is not None and not revalidate:
+        return cached[1].get(stem, [])
+    mtime_ns = os.stat(dirname).st_mtime_ns
+    if cached is None or cached[0] != mtime_ns:
+        prime_directory(dirname, mtime_ns, os.listdir(dirname))
+        cached = index[dirname]
+    return cached[1].get(stem, [])
@@ -1,5 +1,6 @@
 import os
 import sqlite3
+import time
 
 
 from typing import (
@@ -7,19 +8,188 @@ from typing import (
     List,
     Optional,
     Sequence,
+    Tuple,
     TypeAlias,
     Union,
 )
 
 
 from logger import log
+from metrics import timer
+from utils import title_key
 from zerr import zerr
 
 # Function specific variables and aliases
 
 
 dbpath = os.getenv("DATABASE_PATH")
+migrations: List[List[str]] = [
+    [
+        "ALTER TABLE media ADD COLUMN size INTEGER",
+        "ALTER TABLE media ADD COLUMN mtime INTEGER",
+        "ALTER TABLE media ADD COLUMN inode INTEGER",
+        "ALTER TABLE media ADD COLUMN probed_at REAL",
+    ],
+    [
+        "ALTER TABLE media ADD COLUMN title_key TEXT",
+        "UPDATE media SET title_key = title_key(filepath)",
+        "CREATE INDEX idx_media_title_key ON media (title_key)",
+    ],
+    [
+        "CREATE TABLE tracks ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "media_id INTEGER NOT NULL REFERENCES media (id) ON DELETE CASCADE, "
+        "kind TEXT NOT NULL, "
+        "language TEXT, "
+        "codec TEXT, "
+        "source TEXT NOT NULL)",
+        "CREATE INDEX idx_tracks_media ON tracks (media_id, source)",
+        "CREATE INDEX idx_tracks_kind_language "
+        "ON tracks (kind, language, source)",
+        "CREATE INDEX idx_media_complete ON media (complete)",
+        # Seed from the legacy comma-joined columns. Subtitles on rows that
+        # never had embedded subtitles can only have come from sidecars.
+        "WITH RECURSIVE split (media_id, kind, source, item, rest) AS ("
+        "SELECT id, kind, source, '', list || ',' FROM ("
+        "SELECT id, 'audio' AS kind, 'embedded' AS source, audio AS list "
+        "FROM media WHERE audio IS NOT NULL "
+        "UNION ALL SELECT id, 'subtitle', "
+        "CASE WHEN embedded = 'True' THEN 'embedded' ELSE 'sidecar' END, "
+        "subs FROM media WHERE subs IS NOT NULL) "
+        "UNION ALL SELECT media_id, kind, source, "
+        "substr(rest, 1, instr(rest, ',') - 1), "
+        "substr(rest, instr(rest, ',') + 1) FROM split WHERE rest != '') "
+        "INSERT INTO tracks (media_id, kind, language, source) "
+        "SELECT media_id, kind, item, source FROM split WHERE item != ''",
+    ],
+    [
+        "CREATE TABLE checkpoints ("
+        "name TEXT PRIMARY KEY, "
+        "state TEXT NOT NULL, "
+        "updated REAL NOT NULL)",
+    ],
+    [
+        "ALTER TABLE media ADD COLUMN content_hash TEXT",
+        "ALTER TABLE media ADD COLUMN full_hash TEXT",
+        "CREATE INDEX idx_media_content_hash ON media (content_hash)",
+        "CREATE INDEX idx_media_size ON media (size)",
+    ],
+    [
+        # Per-file track questions ("which files lack English subtitles")
+        # seek by media_id instead of scanning every matching track.
+        "CREATE INDEX idx_tracks_media_kind_language "
+        "ON tracks (media_id, kind, language)",
+    ],
+]
 SQLiteConn: TypeAlias = sqlite3.Connection
+SQLiteValue: TypeAlias = Union[int, str, bytes, float, None]
+
+
+# Classes
+
+
+class DBSession:
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        batch_size: int = 500,
+        batch_ms: int = 1000,
+    ) -> None:
+        self.connection = connect(db_path)
+        self.batch_size = max(1, batch_size)
+        self.batch_ms = max(0, batch_ms)
+        self.pending: List[Tuple[str, List[Sequence[SQLiteValue]]]] = []
+        self.uncommitted = 0
+        self.batch_started = time.monotonic()
+
+    def execute(self, query: str, values: Sequence[SQLiteValue] = ()) -> None:
+        if self.uncommitted == 0:
+            self.batch_started = time.monotonic()
+        if self.pending and self.pending[-1][0] == query:
+            self.pending[-1][1].append(values)
+        else:
+            self.pending.append((query, [values]))
+        self.uncommitted += 1
+        elapsed_ms = (time.monotonic() - self.batch_started) * 1000
+        if self.uncommitted >= self.batch_size or elapsed_ms >= self.batch_ms:
+            self.commit()
+
+    def insert(
+        self,
+        table_name: str,
+        values: Sequence[SQLiteValue],
+        columns: Optional[Sequence[str]] = None,
+    ) -> None:
+        placeholders = ", ".join("?" * len(values))
+        if columns:
+            columns_str = ", ".join(columns)
+            query = (
+                f"INSERT INTO {table_name} "
+                f"({columns_str}) VALUES ({placeholders})"
+            )
+        else:
+            query = f"INSERT INTO {table_name} VALUES ({placeholders})"
+        self.execute(query, values)
+
+    def update(
+        self,
+        table_name: str,
+        values: Dict[str, SQLiteValue],
+        conditions: Dict[str, SQLiteValue],
+    ) -> None:
+        set_clause = ", ".join(f"{key} = ?" for key in values.keys())
+        where_clause = " AND ".join(f"{key} = ?" for key in conditions.keys())
+        query = f"UPDATE {table_name} SET {set_clause} WHERE {where_clause}"
+        self.execute(query, list(values.values()) + list(conditions.values()))
+
+    def raw_query(
+        self, query: str, values: Optional[Sequence[SQLiteValue]] = None
+    ) -> list:
+        self.flush()
+        return raw_query(self.connection, query, values)
+
+    def flush(self) -> None:
+        cursor = self.connection.cursor()
+        pending, self.pending = self.pending, []
+        # Outside a transaction RELEASE commits, so open one that only
+        # commit() ends.
+        if pending and not self.connection.in_transaction:
+            cursor.execute("BEGIN")
+        for query, rows in pending:
+            try:
+                cursor.execute("SAVEPOINT batch")
+                cursor.executemany(query, rows)
+                cursor.execute("RELEASE batch")
+            except Exception:
+                cursor.execute("ROLLBACK TO batch")
+                cursor.execute("RELEASE batch")
+                for row in rows:
+                    try:
+                        cursor.execute(query, row)
+                    except Exception as e:
+                        error_info = (
+                            f"[Failed to execute batched write ({query}) "
+                            f"with {row}.]:{zerr(e)}"
+                        )
+                        log(error_info, "CRITICAL")
+
+    def commit(self) -> bool:
+        try:
+            with timer("commit"):
+                self.flush()
+                self.connection.commit()
+            return True
+        except Exception as e:
+            self.connection.rollback()
+            error_info = f"[Failed to commit batched writes.]:{zerr(e)}"
+            log(error_info, "CRITICAL")
+            return False
+        finally:
+            self.uncommitted = 0
+
+    def close(self) -> None:
+        self.commit()
+        close(self.connection)
 
 
 # Functions
@@ -43,6 +213,9 @@ def connect(db_path: Optional[str] = None) -> SQLiteConn:
             connection = sqlite3.connect(str(db_path))
         else:
             connection = sqlite3.connect(":memory:")
+        connection.create_function(
+            "title_key", 1, title_key, deterministic=True
+        )
         return connection
     except Exception as e:
         error_info = f"[Failed to connect to SQLite database.]:{zerr(e)}"
@@ -99,6 +272,26 @@ def insert(
         return False
 
 
+def migrate(connection: SQLiteConn) -> Optional[bool]:
+    try:
+        cursor = connection.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(migrations, 1):
+            if number <= version:
+                continue
+            cursor.execute("BEGIN")
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+        return True
+    except Exception as e:
+        connection.rollback()
+        error_info = f"[Failed to migrate SQLite database.]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return False
+
+
 def newdb(db_path: Optional[str] = None) -> Optional[bool]:
     try:
         if db_path is None:
@@ -119,6 +312,7 @@ def newdb(db_path: Optional[str] = None) -> Optional[bool]:
                 "complete": "TEXT",
             },
         )
+        migrate(connection)
 
         close(connection)
         return True
@@ -129,6 +323,16 @@ def newdb(db_path: Optional[str] = None) -> Optional[bool]:
         return False
 
 
+def open_session(db_path: Optional[str] = None) -> DBSession:
+    if db_path is None:
+        db_path = os.getenv("DB_PATH", dbpath)
+    return DBSession(
+        db_path,
+        batch_size=int(os.getenv("DB_BATCH_SIZE", "500")),
+        batch_ms=int(os.getenv("DB_BATCH_MS", "1000")),
+    )
+
+
 def query(
     connection: SQLiteConn,
     table_name: str,
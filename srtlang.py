@@ -0,0 +1,287 @@
+import codecs
+import math
+import os
+import re
+
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Function specific variables and aliases
+
+
+max_read_bytes = 8192
+max_text_chars = 2000
+min_letters = 40
+min_margin = float(os.getenv("SRT_LANGUAGE_MARGIN", "0.15"))
+unseen_floor = 1e-5
+
+# The same lines of dialogue in each language, so the profiles differ by
+# language rather than by subject.
+samples: Dict[str, str] = {
+    "eng": (
+        "What are you doing here? I told you to wait in the car. We don't "
+        "have much time, they will be back before midnight. Listen to me, "
+        "nobody knows about this and it has to stay that way. Where is your "
+        "brother? He said he would be here an hour ago. I don't know what "
+        "you want from me, but I can't help you anymore. Come on, let's go. "
+        "Thank you for everything you have done for us. Are you sure this "
+        "is the right house? There is something I need to tell you before "
+        "we leave. It was not my fault, you have to believe me. Why would "
+        "anyone want to hurt her? Get out of there right now!"
+    ),
+    "fre": (
+        "Qu'est-ce que tu fais ici ? Je t'ai dit d'attendre dans la "
+        "voiture. Nous n'avons pas beaucoup de temps, ils seront de retour "
+        "avant minuit. Écoute-moi, personne ne sait rien et il faut que ça "
+        "reste comme ça. Où est ton frère ? Il a dit qu'il serait là il y a "
+        "une heure. Je ne sais pas ce que tu veux de moi, mais je ne peux "
+        "plus t'aider. Allez, on y va. Merci pour tout ce que vous avez "
+        "fait pour nous. Tu es sûr que c'est la bonne maison ? Il faut que "
+        "je te dise quelque chose avant de partir. Ce n'était pas ma faute, "
+        "tu dois me croire. Pourquoi est-ce que quelqu'un voudrait lui "
+        "faire du mal ? Sortez de là tout de suite !"
+    ),
+    "ger": (
+        "Was machst du hier? Ich habe dir gesagt, dass du im Auto warten "
+        "sollst. Wir haben nicht viel Zeit, sie sind vor Mitternacht "
+        "zurück. Hör mir zu, niemand weiß davon und das muss auch so "
+        "bleiben. Wo ist dein Bruder? Er hat gesagt, er wäre vor einer "
+        "Stunde hier. Ich weiß nicht, was du von mir willst, aber ich kann "
+        "dir nicht mehr helfen. Komm schon, lass uns gehen. Danke für "
+        "alles, was ihr für uns getan habt. Bist du sicher, dass das das "
+        "richtige Haus ist? Ich muss dir etwas sagen, bevor wir gehen. Es "
+        "war nicht meine Schuld, du musst mir glauben. Warum sollte ihr "
+        "jemand wehtun wollen? Raus da, sofort!"
+    ),
+    "spa": (
+        "¿Qué estás haciendo aquí? Te dije que esperaras en el coche. No "
+        "tenemos mucho tiempo, volverán antes de medianoche. Escúchame, "
+        "nadie sabe nada de esto y tiene que seguir así. ¿Dónde está tu "
+        "hermano? Dijo que estaría aquí hace una hora. No sé qué quieres de "
+        "mí, pero ya no puedo ayudarte. Vamos, vámonos. Gracias por todo lo "
+        "que habéis hecho por nosotros. ¿Estás seguro de que es la casa "
+        "correcta? Hay algo que tengo que decirte antes de irnos. No fue "
+        "culpa mía, tienes que creerme. ¿Por qué querría alguien hacerle "
+        "daño? ¡Salid de ahí ahora mismo!"
+    ),
+    "ita": (
+        "Che cosa fai qui? Ti ho detto di aspettare in macchina. Non "
+        "abbiamo molto tempo, torneranno prima di mezzanotte. Ascoltami, "
+        "nessuno sa niente di questa storia e deve restare così. Dov'è tuo "
+        "fratello? Ha detto che sarebbe arrivato un'ora fa. Non so cosa "
+        "vuoi da me, ma non posso più aiutarti. Dai, andiamo. Grazie per "
+        "tutto quello che avete fatto per noi. Sei sicuro che sia la casa "
+        "giusta? C'è una cosa che devo dirti prima di partire. Non è stata "
+        "colpa mia, devi credermi. Perché qualcuno dovrebbe volerle fare "
+        "del male? Uscite di lì subito!"
+    ),
+    "por": (
+        "O que você está fazendo aqui? Eu disse para você esperar no "
+        "carro. Não temos muito tempo, eles vão voltar antes da meia-noite. "
+        "Escute, ninguém sabe disso e tem que continuar assim. Onde está o "
+        "seu irmão? Ele disse que estaria aqui há uma hora. Não sei o que "
+        "você quer de mim, mas eu não posso mais te ajudar. Vamos embora. "
+        "Obrigado por tudo o que vocês fizeram por nós. Tem certeza de que "
+        "é a casa certa? Preciso te contar uma coisa antes de irmos. Não "
+        "foi culpa minha, você tem que acreditar em mim. Por que alguém ia "
+        "querer machucá-la? Saiam daí agora mesmo!"
+    ),
+    "dut": (
+        "Wat doe je hier? Ik zei toch dat je in de auto moest wachten. We "
+        "hebben niet veel tijd, ze zijn voor middernacht terug. Luister "
+        "naar me, niemand weet hiervan en dat moet zo blijven. Waar is je "
+        "broer? Hij zei dat hij hier een uur geleden zou zijn. Ik weet niet "
+        "wat je van me wilt, maar ik kan je niet meer helpen. Kom op, we "
+        "gaan. Bedankt voor alles wat jullie voor ons hebben gedaan. Weet "
+        "je zeker dat dit het goede huis is? Ik moet je iets vertellen "
+        "voordat we gaan. Het was niet mijn schuld, je moet me geloven. "
+        "Waarom zou iemand haar pijn willen doen? Kom daar nu meteen uit!"
+    ),
+    "swe": (
+        "Vad gör du här? Jag sa ju att du skulle vänta i bilen. Vi har "
+        "inte mycket tid, de kommer tillbaka före midnatt. Lyssna på mig, "
+        "ingen vet om det här och det måste förbli så. Var är din bror? Han "
+        "sa att han skulle vara här för en timme sedan. Jag vet inte vad du "
+        "vill ha av mig, men jag kan inte hjälpa dig längre. Kom igen, nu "
+        "går vi. Tack för allt ni har gjort för oss. Är du säker på att det "
+        "är rätt hus? Det är något jag måste berätta innan vi går. Det var "
+        "inte mitt fel, du måste tro mig. Varför skulle någon vilja skada "
+        "henne? Kom ut därifrån nu!"
+    ),
+    "dan": (
+        "Hvad laver du her? Jeg sagde jo, at du skulle vente i bilen. Vi "
+        "har ikke meget tid, de kommer tilbage før midnat. Hør på mig, "
+        "ingen ved noget om det her, og sådan skal det blive ved med at "
+        "være. Hvor er din bror? Han sagde, at han ville være her for en "
+        "time siden. Jeg ved ikke, hvad du vil have af mig, men jeg kan "
+        "ikke hjælpe dig mere. Kom nu, lad os gå. Tak for alt, hvad I har "
+        "gjort for os. Er du sikker på, at det er det rigtige hus? Der er "
+        "noget, jeg må fortælle dig, før vi går. Det var ikke min skyld, du "
+        "må tro mig. Hvorfor skulle nogen ville gøre hende fortræd? Kom ud "
+        "derfra med det samme!"
+    ),
+    "pol": (
+        "Co ty tutaj robisz? Mówiłem ci, żebyś czekał w samochodzie. Nie "
+        "mamy dużo czasu, wrócą przed północą. Posłuchaj mnie, nikt o tym "
+        "nie wie i tak musi zostać. Gdzie jest twój brat? Powiedział, że "
+        "będzie tu godzinę temu. Nie wiem, czego ode mnie chcesz, ale nie "
+        "mogę ci już pomóc. Chodź, idziemy. Dziękuję za wszystko, co dla "
+        "nas zrobiliście. Jesteś pewien, że to właściwy dom? Muszę ci coś "
+        "powiedzieć, zanim wyjdziemy. To nie była moja wina, musisz mi "
+        "uwierzyć. Dlaczego ktoś miałby chcieć ją skrzywdzić? Wychodźcie "
+        "stamtąd natychmiast!"
+    ),
+    "tur": (
+        "Burada ne yapıyorsun? Sana arabada beklemeni söylemiştim. Fazla "
+        "zamanımız yok, gece yarısından önce geri dönecekler. Beni dinle, "
+        "bunu kimse bilmiyor ve böyle kalması gerekiyor. Kardeşin nerede? "
+        "Bir saat önce burada olacağını söyledi. Benden ne istediğini "
+        "bilmiyorum ama sana artık yardım edemem. Hadi, gidelim. Bizim için "
+        "yaptığınız her şey için teşekkür ederim. Doğru ev olduğundan emin "
+        "misin? Gitmeden önce sana söylemem gereken bir şey var. Benim "
+        "suçum değildi, bana inanmak zorundasın. Neden biri ona zarar "
+        "vermek istesin ki? Hemen oradan çıkın!"
+    ),
+    "fin": (
+        "Mitä sinä täällä teet? Käskin sinun odottaa autossa. Meillä ei ole "
+        "paljon aikaa, he tulevat takaisin ennen keskiyötä. Kuuntele "
+        "minua, kukaan ei tiedä tästä ja niin sen täytyy pysyä. Missä "
+        "veljesi on? Hän sanoi olevansa täällä tunti sitten. En tiedä, mitä "
+        "haluat minulta, mutta en voi enää auttaa sinua. Tule, mennään. "
+        "Kiitos kaikesta, mitä olette tehneet meidän hyväksemme. Oletko "
+        "varma, että tämä on oikea talo? Minun täytyy kertoa sinulle "
+        "jotain ennen kuin lähdemme. Se ei ollut minun syytäni, sinun "
+        "täytyy uskoa minua. Miksi kukaan haluaisi satuttaa häntä? Tulkaa "
+        "sieltä heti pois!"
+    ),
+}
+# Scripts used by a single language in practice are recognised from their
+# Unicode ranges without a profile.
+scripts: List[Tuple[int, int, str]] = [
+    (0x0370, 0x03FF, "gre"),
+    (0x0400, 0x04FF, "rus"),
+    (0x0590, 0x05FF, "heb"),
+    (0x0600, 0x06FF, "ara"),
+    (0x0900, 0x097F, "hin"),
+    (0x0E00, 0x0E7F, "tha"),
+    (0x1100, 0x11FF, "kor"),
+    (0x3040, 0x30FF, "jpn"),
+    (0x4E00, 0x9FFF, "chi"),
+    (0xAC00, 0xD7AF, "kor"),
+]
+markup = re.compile(r"<[^>]*>|\{[^}]*\}")
+non_letters = re.compile(r"[^\w']+|[\d_]+")
+
+
+# Functions
+
+
+def trigrams(text: str) -> Counter:
+    counts: Counter = Counter()
+    for word in non_letters.sub(" ", text.lower()).split():
+        padded = f" {word} "
+        for index in range(len(padded) - 2):
+            counts[padded[index : index + 3]] += 1
+    return counts
+
+
+def build_profile(text: str) -> Dict[str, float]:
+    counts = trigrams(text)
+    total = sum(counts.values())
+    return {gram: math.log(count / total) for gram, count in counts.items()}
+
+
+profiles = {
+    language: build_profile(text) for language, text in samples.items()
+}
+
+
+def read_cue_text(og_filepath: str) -> str:
+    import srt
+
+    # Only the head of the file is read; a cue cut off by the limit is
+    # dropped by the parser.
+    with open(og_filepath, "rb") as stream:
+        data = stream.read(max_read_bytes)
+    try:
+        # Not final, so a character split by the limit is not an error.
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        text = decoder.decode(data)
+    except UnicodeDecodeError:
+        text = data.decode("cp1252", errors="replace")
+    lines = []
+    length = 0
+    try:
+        for subtitle in srt.parse(text, ignore_errors=True):
+            line = markup.sub("", subtitle.content)
+            lines.append(line)
+            length += len(line)
+            if length >= max_text_chars:
+                break
+    except srt.SRTParseError:
+        pass
+    return "\n".join(lines)
+
+
+def detect_script(text: str) -> Optional[str]:
+    letters = 0
+    found: Counter = Counter()
+    for char in text:
+        if not char.isalpha():
+            continue
+        letters += 1
+        code = ord(char)
+        if code < 0x0370:
+            continue
+        for start, end, language in scripts:
+            if start <= code <= end:
+                found[language] += 1
+                break
+    if not found or letters == 0:
+        return None
+    # Japanese mixes kana with Chinese characters.
+    if found["jpn"] and found["jpn"] + found["chi"] >= letters / 2:
+        return "jpn"
+    language, count = found.most_common(1)[0]
+    return language if count >= letters / 2 else None
+
+
+def classify(text: str) -> Tuple[str, float]:
+    script = detect_script(text)
+    if script is not None:
+        return script, 1.0
+    if sum(1 for char in text if char.isalpha()) < min_letters:
+        return "unknown", 0.0
+    counts = trigrams(text)
+    total = sum(counts.values())
+    floor = math.log(unseen_floor)
+    scores = sorted(
+        (
+            sum(
+                count * profile.get(gram, floor)
+                for gram, count in counts.items()
+            )
+            / total,
+            language,
+        )
+        for language, profile in profiles.items()
+    )
+    best, language = scores[-1]
+    margin = best - scores[-2][0]
+    return language, min(1.0, margin)
+
+
+def detect_language(og_filepath: str) -> Tuple[str, float]:
+    try:
+        return classify(read_cue_text(og_filepath))
+    except OSError:
+        return "unknown", 0.0
+
+
+def sidecar_language(
+    filename_code: str, detected: str, confidence: float
+) -> str:
+    if detected != "unknown" and confidence >= min_margin:
+        return detected
+    return filename_code or "unknown"
@@ -2,15 +2,62 @@ import glob
 import hashlib
 import os
 import platform
+import re
 
 
-from typing import Optional
+from typing import BinaryIO, Iterator, Optional, Tuple
 
 
 from logger import log
 from zerr import zerr
 
 
+languages = {
+    "ar": ("ara", "arabic"),
+    "bg": ("bul", "bulgarian"),
+    "cs": ("cze", "czech"),
+    "da": ("dan", "danish"),
+    "de": ("ger", "german"),
+    "el": ("gre", "greek"),
+    "en": ("eng", "english"),
+    "es": ("spa", "spanish"),
+    "fi": ("fin", "finnish"),
+    "fr": ("fre", "french"),
+    "he": ("heb", "hebrew"),
+    "hi": ("hin", "hindi"),
+    "hu": ("hun", "hungarian"),
+    "id": ("ind", "indonesian"),
+    "it": ("ita", "italian"),
+    "ja": ("jpn", "japanese"),
+    "ko": ("kor", "korean"),
+    "nl": ("dut", "dutch"),
+    "no": ("nor", "norwegian"),
+    "pl": ("pol", "polish"),
+    "pt": ("por", "portuguese"),
+    "ro": ("rum", "romanian"),
+    "ru": ("rus", "russian"),
+    "sv": ("swe", "swedish"),
+    "th": ("tha", "thai"),
+    "tr": ("tur", "turkish"),
+    "uk": ("ukr", "ukrainian"),
+    "vi": ("vie", "vietnamese"),
+    "zh": ("chi", "chinese"),
+}
+language_aliases = {
+    alias: code
+    for short, (code, name) in languages.items()
+    for alias in (short, code, name)
+}
+og_path_table = str.maketrans({"/": os.sep, "`": "'"})
+db_path_table = str.maketrans({"\\": "/", "'": "`"})
+release_tags = re.compile(
+    r"\b(?:480p|576p|720p|1080[pi]|2160p|4k|uhd|hdr10|hdr|dv|bluray|"
+    r"bdrip|brrip|remux|web ?dl|webrip|web|hdtv|dvdrip|x26[45]|h ?26[45]|"
+    r"hevc|avc|xvid|divx|aac|ac3|eac3|dts|truehd|atmos|10bit|8bit|proper|"
+    r"repack|extended|unrated)\b"
+)
+
+
 def find_newest_file_in_dir(directory: str, extension: str) -> Optional[str]:
     try:
         files = glob.glob(f"{directory}/*{extension}")
@@ -38,3 +85,95 @@ def get_system_id() -> Optional[str]:
         error_info = f"[Failed to generate system ID.]:{zerr(e)}"
         log(error_info, "CRITICAL")
         return None
+
+
+def normalize_path(file_path: str, resolve: bool = True) -> Tuple[str, str]:
+    if resolve:
+        file_path = os.path.abspath(file_path)
+    og_filepath = file_path.translate(og_path_table)
+    filepath = og_filepath.translate(db_path_table)
+    return og_filepath, filepath
+
+
+def path_range(folder: str) -> Tuple[str, str]:
+    # Database paths under folder sort strictly between these bounds, so a
+    # range on filepath keeps the unique index usable; "0" is the character
+    # after "/".
+    _, prefix = normalize_path(os.path.abspath(folder), resolve=False)
+    prefix = prefix.rstrip("/")
+    return prefix + "/", prefix + "0"
+
+
+def file_fingerprint(og_filepath: str) -> Tuple[int, int, int]:
+    stat = os.stat(og_filepath)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def title_key(filepath: str) -> str:
+    basename = filepath.replace("\\", "/").rsplit("/", 1)[-1]
+    stem = os.path.splitext(basename)[0].lower()
+    stem = re.sub(r"[\[{].*?[\]}]", " ", stem)
+    stem = re.sub(r"[\W_]+", " ", stem)
+    stem = release_tags.sub(" ", stem)
+    return " ".join(stem.split())
+
+
+def language_code(value: str) -> str:
+    value = value.strip().lower()
+    return language_aliases.get(value, value)
+
+
+def content_key(
+    og_filepath: str,
+    size: Optional[int] = None,
+    block_size: int = 65536,
+    samples: int = 0,
+) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(og_filepath, "rb") as stream:
+        if size is None:
+            size = os.fstat(stream.fileno()).st_size
+        digest.update(stream.read(block_size))
+        # Evenly spaced blocks between the head and the tail.
+        for index in range(1, samples + 1):
+            offset = size * index // (samples + 1)
+            if block_size <= offset <= size - 2 * block_size:
+                stream.seek(offset)
+                digest.update(stream.read(block_size))
+        if size > block_size:
+            stream.seek(max(block_size, size - block_size))
+            digest.update(stream.read(block_size))
+    return f"{size}:{digest.hexdigest()}"
+
+
+def full_hash(og_filepath: str, buffer_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(og_filepath, "rb", buffering=0) as stream:
+        while True:
+            read = stream.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    return digest.hexdigest()
+
+
+def read_paths(stream: BinaryIO, separator: bytes = b"\n") -> Iterator[str]:
+    # Reads incrementally, so paths piped in by a hook are handled as they
+    # arrive rather than after the writer closes the stream.
+    buffer = b""
+    while True:
+        chunk = stream.read1(65536)
+        buffer += chunk
+        if chunk:
+            *entries, buffer = buffer.split(separator)
+        else:
+            entries, buffer = [buffer], b""
+        for entry in entries:
+            if separator == b"\n":
+                entry = entry.rstrip(b"\r")
+            if entry:
+                yield os.fsdecode(entry)
+        if not chunk:
+            break
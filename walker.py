@@ -0,0 +1,80 @@
+import os
+
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+from logger import log
+from metrics import timer
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+media_extensions = (".mp4", ".mkv", ".avi")
+sidecar_extensions = (".srt",)
+MediaEntry = Tuple[str, int, int, int]
+DirListing = Tuple[str, int, List[str], List[MediaEntry]]
+
+
+# Functions
+
+
+def list_directory(dirname: str) -> Tuple[DirListing, List[str]]:
+    with timer("walk", dirname):
+        return scan_directory(dirname)
+
+
+def scan_directory(dirname: str) -> Tuple[DirListing, List[str]]:
+    mtime_ns = os.stat(dirname).st_mtime_ns
+    sidecars: List[str] = []
+    media: List[MediaEntry] = []
+    subdirs: List[str] = []
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(media_extensions):
+                    stat = entry.stat()
+                    media.append(
+                        (
+                            entry.path,
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                            entry.inode(),
+                        )
+                    )
+                elif entry.name.endswith(sidecar_extensions):
+                    sidecars.append(entry.name)
+            except OSError as e:
+                error_info = f"[Failed to stat {entry.path}]:{zerr(e)}"
+                log(error_info, "CRITICAL")
+    return (dirname, mtime_ns, sidecars, media), subdirs
+
+
+def walk_directories(
+    tops: List[str],
+    threads: int = 8,
+    skip: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Tuple[DirListing, List[str]]]:
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        in_flight = {
+            executor.submit(list_directory, top): top for top in tops
+        }
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                dirname = in_flight.pop(future)
+                try:
+                    listing, subdirs = future.result()
+                except Exception as e:
+                    error_info = f"[Failed to list {dirname}]:{zerr(e)}"
+                    log(error_info, "CRITICAL")
+                    continue
+                if skip is not None:
+                    subdirs = [path for path in subdirs if not skip(path)]
+                for subdir in subdirs:
+                    in_flight[executor.submit(list_directory, subdir)] = subdir
+                yield listing, subdirs
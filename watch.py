@@ -0,0 +1,317 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+
+from typing import Dict, List, Optional, Set, Tuple
+
+
+from app import check_audio_subtitle
+from cache import close_cache
+from logger import log
+from sidecar import index, parse_sidecar, prime_directory
+from sqlite import open_session, DBSession
+from utils import file_fingerprint, normalize_path
+from walker import media_extensions, scan_directory, sidecar_extensions
+from zerr import zerr
+
+# Function specific variables and aliases
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+watch_mask = (
+    IN_CLOSE_WRITE
+    | IN_MOVED_TO
+    | IN_MOVED_FROM
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+)
+event_header = struct.Struct("iIII")
+Pending = Dict[str, Tuple[float, int, bool]]
+
+
+# Classes
+
+
+class Inotify:
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths: Dict[int, str] = {}
+        self.watched: Set[str] = set()
+
+    def add(self, dirname: str) -> bool:
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(dirname), watch_mask
+        )
+        if wd < 0:
+            errno = ctypes.get_errno()
+            error_info = (
+                f"[Failed to watch {dirname}, relying on sweeps]:"
+                f"{os.strerror(errno)}"
+            )
+            log(error_info, "WARNING")
+            return False
+        self.paths[wd] = dirname
+        self.watched.add(dirname)
+        return True
+
+    def read(self, timeout: float) -> List[Tuple[str, int]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + event_header.size <= len(data):
+            wd, mask, _, length = event_header.unpack_from(data, pos)
+            pos += event_header.size
+            name = data[pos : pos + length].rstrip(b"\x00")
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("", mask))
+                continue
+            if mask & IN_IGNORED:
+                self.watched.discard(self.paths.pop(wd, ""))
+                continue
+            dirname = self.paths.get(wd)
+            if dirname is not None and name:
+                path = os.path.join(dirname, os.fsdecode(name))
+                events.append((path, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+# Functions
+
+
+def media_for_sidecar(og_filepath: str) -> List[str]:
+    parsed = parse_sidecar(os.path.basename(og_filepath))
+    if parsed is None:
+        return []
+    dirname = os.path.dirname(og_filepath)
+    try:
+        names = os.listdir(dirname)
+    except OSError:
+        return []
+    return [
+        os.path.join(dirname, name)
+        for name in names
+        if name.endswith(media_extensions)
+        and os.path.splitext(name)[0] == parsed[0]
+    ]
+
+
+def queue_file(
+    pending: Pending, og_filepath: str, now: float, forced: bool = False
+) -> None:
+    try:
+        size = os.stat(og_filepath).st_size
+    except OSError:
+        size = -1
+    previous = pending.get(og_filepath)
+    forced = forced or (previous is not None and previous[2])
+    pending[og_filepath] = (now, size, forced)
+
+
+def queue_event(pending: Pending, og_filepath: str, now: float) -> None:
+    if og_filepath.endswith(sidecar_extensions):
+        for media in media_for_sidecar(og_filepath):
+            queue_file(pending, media, now, forced=True)
+    elif og_filepath.endswith(media_extensions):
+        queue_file(pending, og_filepath, now)
+
+
+def rescan_directory(
+    dirname: str,
+    dir_mtimes: Dict[str, int],
+    pending: Optional[Pending],
+    now: float,
+) -> List[str]:
+    listing, subdirs = scan_directory(dirname)
+    _, mtime_ns, sidecars, media = listing
+    previous = index.get(dirname)
+    prime_directory(dirname, mtime_ns, sidecars)
+    dir_mtimes[dirname] = mtime_ns
+    if pending is not None:
+        current = index[dirname][1]
+        old = previous[1] if previous is not None else {}
+        for path, _, _, _ in media:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            # A changed sidecar set forces a rescan of unchanged media.
+            forced = old.get(stem) != current.get(stem)
+            queue_file(pending, path, now, forced)
+    return subdirs
+
+
+def track_tree(
+    top: str,
+    notifier: Optional[Inotify],
+    dir_mtimes: Dict[str, int],
+    pending: Optional[Pending] = None,
+    now: float = 0.0,
+) -> None:
+    stack = [top]
+    while stack:
+        dirname = stack.pop()
+        if notifier is not None and dirname not in notifier.watched:
+            notifier.add(dirname)
+        try:
+            stack.extend(rescan_directory(dirname, dir_mtimes, pending, now))
+        except OSError as e:
+            error_info = f"[Failed to list {dirname}]:{zerr(e)}"
+            log(error_info, "WARNING")
+            dir_mtimes.pop(dirname, None)
+
+
+def sweep(
+    notifier: Optional[Inotify],
+    dir_mtimes: Dict[str, int],
+    pending: Pending,
+    now: float,
+) -> None:
+    for dirname, mtime_ns in list(dir_mtimes.items()):
+        try:
+            if os.stat(dirname).st_mtime_ns == mtime_ns:
+                continue
+            subdirs = rescan_directory(dirname, dir_mtimes, pending, now)
+        except OSError:
+            dir_mtimes.pop(dirname, None)
+            continue
+        for subdir in subdirs:
+            if subdir not in dir_mtimes:
+                track_tree(subdir, notifier, dir_mtimes, pending, now)
+
+
+def scan_changed(session: DBSession, og_filepath: str, forced: bool) -> None:
+    og_filepath, filepath = normalize_path(og_filepath)
+    record = session.raw_query(
+        "SELECT id, complete, size, mtime, inode, probed_at FROM media "
+        "WHERE filepath = ?",
+        [filepath],
+    )
+    if record:
+        record_id, complete = record[0][:2]
+        unchanged = (
+            record[0][5] is not None
+            and tuple(record[0][2:5]) == file_fingerprint(og_filepath)
+        )
+        if unchanged and not forced:
+            return
+        if complete == "True":
+            session.update("media", {"complete": None}, {"id": record_id})
+    result = check_audio_subtitle(filepath, session)
+    if "error" not in result:
+        log(f"[Watch]:Scanned {filepath}", "INFO", success=True)
+
+
+def process_ready(
+    session: DBSession, pending: Pending, now: float, debounce: float
+) -> None:
+    scanned = 0
+    for og_filepath, (last_seen, size, forced) in list(pending.items()):
+        if now - last_seen < debounce:
+            continue
+        try:
+            current = os.stat(og_filepath).st_size
+        except OSError:
+            pending.pop(og_filepath)
+            continue
+        if current != size:
+            # Still being written; wait for another quiet period.
+            pending[og_filepath] = (now, current, forced)
+            continue
+        pending.pop(og_filepath)
+        try:
+            scan_changed(session, og_filepath, forced)
+            scanned += 1
+        except Exception as e:
+            error_info = f"[Failed to scan {og_filepath}]:{zerr(e)}"
+            log(error_info, "CRITICAL")
+    if scanned:
+        session.commit()
+
+
+def watch(
+    roots: List[str], interval: int = 300, debounce: float = 2.0
+) -> None:
+    try:
+        session = open_session()
+    except Exception as e:
+        error_info = f"[Failed to connect to database for watch]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+        return
+    notifier = None
+    try:
+        notifier = Inotify()
+    except OSError as e:
+        error_info = f"[inotify unavailable, sweeping only]:{zerr(e)}"
+        log(error_info, "WARNING")
+        interval = interval or 300
+    dir_mtimes: Dict[str, int] = {}
+    pending: Pending = {}
+    try:
+        for root in roots:
+            track_tree(os.path.abspath(root), notifier, dir_mtimes)
+        log(
+            f"[Watch]:Watching {len(dir_mtimes)} directories under "
+            f"{', '.join(roots)}",
+            "INFO",
+            success=True,
+        )
+        next_sweep = time.monotonic() + interval
+        while True:
+            timeout = debounce / 2 if pending else 1.0
+            if notifier is not None:
+                events = notifier.read(timeout)
+            else:
+                time.sleep(timeout)
+                events = []
+            now = time.monotonic()
+            for path, mask in events:
+                if mask & IN_Q_OVERFLOW:
+                    log("[Watch]:Event queue overflowed, sweeping", "WARNING")
+                    next_sweep = now
+                elif mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        track_tree(path, notifier, dir_mtimes, pending, now)
+                else:
+                    queue_event(pending, path, now)
+            if interval and now >= next_sweep:
+                sweep(notifier, dir_mtimes, pending, now)
+                next_sweep = now + interval
+            process_ready(session, pending, now, debounce)
+    except KeyboardInterrupt:
+        log("[Watch]:Stopped", "INFO", success=True)
+    except Exception as e:
+        error_info = f"[Failed while watching for changes]:{zerr(e)}"
+        log(error_info, "CRITICAL")
+    finally:
+        if notifier is not None:
+            notifier.close()
+        session.close()
+        close_cache()